@@ -10,17 +10,65 @@ En este modelo se considera que las centrales son tomadoras de
 precio que no tienen impacto en el precio del servicio y que
 conocen a la perfección los precios del mercado y la utilización
 de regulación secundaria del día siguiente.
+
+Los días son independientes entre sí, por lo que se reparten entre
+varios procesos. Cada proceso tiene su propio WorkSpace de Gams en
+una carpeta temporal propia, con su propio archivo gdx.
 """
 
 
-import gams
+try:
+    import gams
+    import gams.transfer as gt
+except ImportError:
+    gams = None
 import sys
 import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
 import pandas as pd
 
+import modelo_brs
+
 
-# Crea el WorkSpace de Gams en el que vamos a trabajar
-ws = gams.GamsWorkspace(debug=gams.DebugLevel.KeepFiles)
+# Rutas de los datos del mercado, de los modelos y de los resultados
+carpeta_datos = (
+    "/home/alejandro/Documentos/Universidad/MII_2/TFM/"
+    + "TrabajoConDatos/informacion_procesada/"
+)
+carpeta_optimizacion = (
+    "/home/alejandro/Documentos/Universidad/MII_2/TFM/Optimizacion/"
+)
+ruta_modelo_sep = (
+    carpeta_optimizacion + "modelo_varias_centrales_sin_datos_separadas.gms"
+)
+ruta_modelo_jun = (
+    carpeta_optimizacion + "modelo_varias_centrales_sin_datos_juntas.gms"
+)
+
+# Número de procesos que resuelven días a la vez
+procesos = os.cpu_count()
+
+# Resolvedor de los modelos: "gams" para resolver los archivos .gms
+# con GAMS o "highs" para resolver las mismas ecuaciones con HiGHS
+# desde Python (modelo_brs.py), sin necesidad de GAMS
+motor = "gams"
+
+# Con el motor "gams", si es True cada modelo se compila una sola vez
+# por número de horas del día (23, 24 o 25) como instancia de modelo
+# y cada día sólo se cambian sus parámetros horarios antes de
+# resolverlo, partiendo de la solución del día anterior si el
+# resolvedor MIP lo permite
+instancias_modelo = False
+
+# Opciones de los resolvedores MIP para que las instancias de modelo
+# partan de la solución anterior
+opciones_arranque = {
+    "cplex": "mipstart 1",
+    "gurobi": "mipstart 1",
+}
 
 # Datos comunes a todos los días
 centrales = ["1","2","3"]
@@ -34,199 +82,305 @@ coste_variable = {
     "1": 40, "2": 15, "3": 5,
 }
 
-# Importa los datos genéricos del mercado eléctrico
-df_total = pd.read_csv(
-    "/home/alejandro/Documentos/Universidad/MII_2/TFM/"
-    + "TrabajoConDatos/informacion_procesada/tabla_datos_mercado.csv",
-    sep=";", index_col=0,
-)
-
-# Crea el índice como fechas
-df_total.index=pd.date_range(
-    start='2014-01-01',end='2018-12-31 23:00',freq='H',tz='Europe/Madrid'
-)
-
-# Elimina los NaNs sin poner ceros en los requerimientos de BRS
-# para evitar dividir por 0 en el modelo
-(df_total["Requerimientos Banda de regulación secundaria a subir"]
-    .fillna(method="pad",inplace=True,))
-(df_total["Requerimientos Banda de regulación secundaria a bajar"]
-    .fillna(method="pad",inplace=True,))
-df_total.fillna(0,inplace=True)
+# Parámetros del modelo que dependen de la hora: nombre en GAMS,
+# columna de la tabla de datos del mercado y descripción
+parametros_horarios = [
+    ("pr_prog", "Precio mercado SPOT Diario",
+     "precio del mercado diario"),
+    ("pr_brs", "Precio Banda de regulación secundaria",
+     "precio de la BRS"),
+    ("pr_ut_res_sub", "Precio de Regulación Secundaria subir",
+     "precio de la utilizacion de BRS a subir"),
+    ("pr_ut_res_baj", "Precio de Regulación Secundaria bajar",
+     "precio de la utilizacion de BRS a bajar"),
+    ("requerimiento_brs_subir",
+     "Requerimientos Banda de regulación secundaria a subir",
+     "requerimiento de brs a subir"),
+    ("requerimiento_brs_bajar",
+     "Requerimientos Banda de regulación secundaria a bajar",
+     "requerimiento de brs a bajar"),
+    ("utilizacion_reserva_bajar",
+     "Energía utilizada de Regulación Secundaria bajar",
+     "cantidad de energía de reserva secundaria utilizada a bajar"),
+    ("utilizacion_reserva_subir",
+     "Energía utilizada de Regulación Secundaria subir",
+     "cantidad de energía de reserva secundaria utilizada a subir"),
+]
+
+# Modelo de los archivos .gms resuelto por cada trabajo
+modelos_gams = {
+    "modelo_sep": "centrales_separadas",
+    "modelo_jun": "centrales_agrupadas",
+}
 
-# Indica la ruta del modelo y de la base de datos
-modelo_sep = ws.add_job_from_file(
-    "/home/alejandro/Documentos/Universidad/MII_2/TFM/"
-    + "Optimizacion/modelo_varias_centrales_sin_datos_separadas.gms"
-    )
-modelo_jun = ws.add_job_from_file(
-    "/home/alejandro/Documentos/Universidad/MII_2/TFM/"
-    + "Optimizacion/modelo_varias_centrales_sin_datos_juntas.gms"
-    )
-opt = ws.add_options()
-opt.defines["gdxincname"] = (
-    "/home/alejandro/Documentos/Universidad/MII_2/TFM/"
-    + "Optimizacion/datos_partida.gdx"
+# Parámetros horarios que cambian cada día en las instancias de
+# modelo. Los factores de utilización se calculan en Python, ya que
+# en GAMS se calculan antes de resolver a partir de la utilización.
+parametros_modificables = [
+    "pr_prog", "pr_brs", "pr_ut_res_sub", "pr_ut_res_baj",
+    "requerimiento_brs_subir", "requerimiento_brs_bajar",
+    "fact_ut_sub", "fact_ut_baj",
+]
+
+# Columnas de los resultados de cada día
+columnas_resultados = (
+    ["p" + central for central in centrales]
+    + ["brs_sub" + central for central in centrales]
+    + ["brs_baj" + central for central in centrales]
+    + ["ben"]
 )
 
-inicio = True
-mode = 'w'
-
-# Bucle con la simulación de cada día para evitar sobrepasar
-# el límite de la licencia
-for fecha in pd.date_range(start="2014",end="2018-12-31 23:00",freq="d"):
-
-    # Crea un dataframe en el que guardar los datos de salida
-    df_opt_sep = pd.DataFrame(
-        columns=["p1","p2","p3","brs_sub1","brs_sub2","brs_sub3",
-        "brs_baj1","brs_baj2","brs_baj3","ben"])
-    df_opt_jun = pd.DataFrame(
-        columns=["p1","p2","p3","brs_sub1","brs_sub2","brs_sub3",
-        "brs_baj1","brs_baj2","brs_baj3","ben"])
-    
-    df_dia = df_total.loc[fecha.strftime("%Y-%m-%d")]
-
-    # Crea un objeto GamsDatabase
-    db = ws.add_database()
-
-    # Añade set i de centrales
-    i = db.add_set("i", 1, "centrales")
-    for central in centrales:
-        i.add_record(central)
-
-    # Añade parámetros de cada central
-    pm = db.add_parameter_dc("pm",[i],"potencia máxima de la central i")
-    for central in centrales:
-        pm.add_record(central).value = potencia_maxima[central]
-
-    cf = db.add_parameter_dc("cf",[i],"coste fijo horario por MW de la central i")
-    for central in centrales:
-        cf.add_record(central).value = coste_fijo[central]
-
-    cv = db.add_parameter_dc(
-        "cv",[i],
-        "coste variable horario por MW de la central i")
-    for central in centrales:
-        cv.add_record(central).value = coste_variable[central]
-
-    # Añade escalar genérico grande
-    m = db.add_parameter("m", 0, "número muy grande")
-    m.add_record().value = 1000000
-
-    # Añadimos parámetros particulares del día que dependen
-    # de la hora
-    t = db.add_set("t",1,"hora del día")
-    for hora in df_dia.index:
-        t.add_record(str(hora))
-
-    pr_prog = db.add_parameter_dc(
-        "pr_prog",[t],"precio del mercado diario")
-    for hora in df_dia.index:
-        pr_prog.add_record(str(hora)).value = (
-            df_dia.loc[hora,"Precio mercado SPOT Diario"])
-
-    pr_brs = db.add_parameter_dc("pr_brs",[t],"precio de la BRS")
-    for hora in df_dia.index:
-        pr_brs.add_record(str(hora)).value = (
-            df_dia.loc[hora,"Precio Banda de regulación secundaria"])
-
-    pr_ut_res_sub = db.add_parameter_dc(
-        "pr_ut_res_sub",[t],"precio de la utilizacion de BRS a subir")
-    for hora in df_dia.index:
-        pr_ut_res_sub.add_record(str(hora)).value = (
-            df_dia.loc[hora,"Precio de Regulación Secundaria subir"])
-        
-    pr_ut_res_baj = db.add_parameter_dc(
-        "pr_ut_res_baj",[t],"precio de la utilizacion de BRS a bajar")
-    for hora in df_dia.index:
-        pr_ut_res_baj.add_record(str(hora)).value = (
-            df_dia.loc[hora,"Precio de Regulación Secundaria bajar"])
-        
-    requerimiento_brs_subir = db.add_parameter_dc(
-        "requerimiento_brs_subir",[t],"requerimiento de brs a subir")
-    for hora in df_dia.index:
-        requerimiento_brs_subir.add_record(str(hora)).value = (
-            df_dia.loc[
-                hora,
-                "Requerimientos Banda de regulación secundaria a subir"])
-        
-    requerimiento_brs_bajar = db.add_parameter_dc(
-        "requerimiento_brs_bajar",[t],"requerimiento de brs a bajar")
-    for hora in df_dia.index:
-        requerimiento_brs_bajar.add_record(str(hora)).value = (
-            df_dia.loc[
-                hora,
-                "Requerimientos Banda de regulación secundaria a bajar"])
-
-    utilizacion_reserva_bajar = db.add_parameter_dc(
-        "utilizacion_reserva_bajar",[t],
-        "cantidad de energía de reserva secundaria utilizada a bajar")
-    for hora in df_dia.index:
-        utilizacion_reserva_bajar.add_record(str(hora)).value = (
-            df_dia.loc[
-                hora,
-                "Energía utilizada de Regulación Secundaria bajar"])
-
-    utilizacion_reserva_subir = db.add_parameter_dc(
-        "utilizacion_reserva_subir",[t],
-        "cantidad de energía de reserva secundaria utilizada a subir")
-    for hora in df_dia.index:
-        utilizacion_reserva_subir.add_record(str(hora)).value = (
-            df_dia.loc[
-                hora,
-                "Energía utilizada de Regulación Secundaria subir"])
-
-    # Exporta la base de datos
-    db.export(
-        "/home/alejandro/Documentos/Universidad/MII_2/TFM/"
-        + "Optimizacion/datos_partida.gdx")
-
-    # Ejecuta el modelo con los datos de la base de datos
-    modelo_sep.run(opt)
-    modelo_jun.run(opt)
-
-    # Guarda los datos obtenidos de la simulación
-    for rec in modelo_sep.out_db['pot_prog']:
-        df_opt_sep.loc[rec.keys[1],"p"+rec.keys[0]] = rec.level
-    for rec in modelo_sep.out_db['brs_sub']:
-        df_opt_sep.loc[rec.keys[1],"brs_sub"+rec.keys[0]] = rec.level
-    for rec in modelo_sep.out_db['brs_baj']:
-        df_opt_sep.loc[rec.keys[1],"brs_baj"+rec.keys[0]] = rec.level
-    for rec in modelo_sep.out_db["ben"]:
-        df_opt_sep.loc[rec.keys[0],"ben"] = rec.level
-    
-    for rec in modelo_jun.out_db['pot_prog']:
-        df_opt_jun.loc[rec.keys[1],"p"+rec.keys[0]] = rec.level
-    for rec in modelo_jun.out_db['brs_sub']:
-        df_opt_jun.loc[rec.keys[1],"brs_sub"+rec.keys[0]] = rec.level
-    for rec in modelo_jun.out_db['brs_baj']:
-        df_opt_jun.loc[rec.keys[1],"brs_baj"+rec.keys[0]] = rec.level
-    for rec in modelo_jun.out_db["ben"]:
-        df_opt_jun.loc[rec.keys[0],"ben"] = rec.level
+# Objetos de Gams de cada proceso, creados por iniciar_trabajador
+trabajador = {}
 
 
-    # Exporta los datos al archivo
-    df_opt_sep.sort_index()
-    df_opt_sep.to_csv("/home/alejandro/Documentos/Universidad/MII_2/TFM/"
-        + "Optimizacion/optimizacion_separadas.csv", mode=mode,header=inicio)
-    df_opt_jun.sort_index()
-    df_opt_jun.to_csv("/home/alejandro/Documentos/Universidad/MII_2/TFM/"
-        + "Optimizacion/optimizacion_juntas.csv",mode=mode,header=inicio)
-    
-    inicio = False
-    mode = 'a'
-
-
-    # Elimina todos los registros de la base de datos para
-    # utilizarla de nuevo
-    db.clear()
-    print(fecha)
-
-
-print("El programa ha terminado.")
+def leer_datos_mercado(ruta):
+    """Lee la tabla de datos del mercado y prepara sus valores para
+    el modelo.
+    """
+    df_total = pd.read_csv(ruta, sep=";", index_col=0)
 
+    # Crea el índice como fechas
+    df_total.index=pd.date_range(
+        start='2014-01-01',end='2018-12-31 23:00',freq='H',
+        tz='Europe/Madrid'
+    )
 
+    # Elimina los NaNs sin poner ceros en los requerimientos de BRS
+    # para evitar dividir por 0 en el modelo
+    (df_total["Requerimientos Banda de regulación secundaria a subir"]
+        .fillna(method="pad",inplace=True,))
+    (df_total["Requerimientos Banda de regulación secundaria a bajar"]
+        .fillna(method="pad",inplace=True,))
+    df_total.fillna(0,inplace=True)
+    return df_total
+
+
+def iniciar_trabajador():
+    """Crea en el proceso actual su WorkSpace de Gams en una carpeta
+    temporal propia, los trabajos de los dos modelos y el contenedor
+    de datos con los datos comunes a todos los días. La carpeta se
+    borra al terminar el proceso. Con el motor "highs" no hace falta
+    preparar nada.
+    """
+    if motor == "highs":
+        return
+    if gams is None:
+        raise ImportError(
+            'No se encuentra la API de Python de GAMS, necesaria con el '
+            'motor "gams". Puede usarse el motor "highs" en su lugar.')
+
+    carpeta = tempfile.mkdtemp(prefix="optimizacion_brs_")
+    Finalize(None, shutil.rmtree, args=(carpeta, True), exitpriority=0)
+
+    ws = gams.GamsWorkspace(working_directory=carpeta)
+    opt = ws.add_options()
+    opt.defines["gdxincname"] = os.path.join(carpeta, "datos_partida.gdx")
+
+    # Crea una sola vez el contenedor de datos de GAMS con los datos
+    # comunes a todos los días. Cada día sólo se cambian los registros
+    # de las horas y de los parámetros horarios.
+    datos = gt.Container(system_directory=ws.system_directory)
+    i = gt.Set(datos, "i", records=centrales, description="centrales")
+    gt.Parameter(
+        datos, "pm", [i],
+        records=[(central, potencia_maxima[central])
+                 for central in centrales],
+        description="potencia máxima de la central i")
+    gt.Parameter(
+        datos, "cf", [i],
+        records=[(central, coste_fijo[central]) for central in centrales],
+        description="coste fijo horario por MW de la central i")
+    gt.Parameter(
+        datos, "cv", [i],
+        records=[(central, coste_variable[central])
+                 for central in centrales],
+        description="coste variable horario por MW de la central i")
+    gt.Parameter(
+        datos, "m", records=1000000, description="número muy grande")
+    t = gt.Set(datos, "t", description="hora del día")
+
+    # Archivo de opciones del resolvedor MIP para que las instancias
+    # de modelo partan de la solución del día anterior
+    resolvedor = (opt.mip or "").lower()
+    opciones_instancias = None
+    if resolvedor in opciones_arranque:
+        with open(os.path.join(carpeta, resolvedor + ".opt"), "w") as archivo:
+            archivo.write(opciones_arranque[resolvedor] + "\n")
+        opciones_instancias = gams.GamsModelInstanceOpt(opt_file=1)
+
+    trabajador.update({
+        "ws": ws,
+        "opt": opt,
+        "datos": datos,
+        "t": t,
+        "parametros_dia": {
+            nombre: gt.Parameter(datos, nombre, [t], description=descripcion)
+            for nombre, _, descripcion in parametros_horarios
+        },
+        "modelo_sep": ws.add_job_from_file(ruta_modelo_sep),
+        "modelo_jun": ws.add_job_from_file(ruta_modelo_jun),
+        "instancias": {},
+        "opciones_instancias": opciones_instancias,
+    })
+
+
+def leer_resultados(base_datos, horas=None):
+    """Devuelve un dataframe con la potencia programada, la BRS a
+    subir y a bajar de cada central y el beneficio de cada hora de la
+    base de datos del modelo resuelto. Si se pasan las horas del día,
+    las horas "1", "2"... de las instancias de modelo se cambian por
+    ellas.
+    """
+    def hora(clave):
+        return clave if horas is None else horas[int(clave) - 1]
+
+    df_opt = pd.DataFrame(columns=columnas_resultados)
+    for rec in base_datos['pot_prog']:
+        df_opt.loc[hora(rec.keys[1]),"p"+rec.keys[0]] = rec.level
+    for rec in base_datos['brs_sub']:
+        df_opt.loc[hora(rec.keys[1]),"brs_sub"+rec.keys[0]] = rec.level
+    for rec in base_datos['brs_baj']:
+        df_opt.loc[hora(rec.keys[1]),"brs_baj"+rec.keys[0]] = rec.level
+    for rec in base_datos["ben"]:
+        df_opt.loc[hora(rec.keys[0]),"ben"] = rec.level
+    return df_opt
+
+
+def escribir_datos(df_dia, horas):
+    """Escribe en el gdx del proceso los datos de un día, con las
+    horas pasadas como elementos del conjunto t.
+    """
+    # Añade de una vez las horas del día y los valores de cada
+    # parámetro horario a partir de las columnas del día
+    trabajador["t"].setRecords(horas)
+    for nombre, columna, _ in parametros_horarios:
+        trabajador["parametros_dia"][nombre].setRecords(
+            pd.DataFrame({"t": horas, "value": df_dia[columna].to_numpy()}))
+
+    # Exporta la base de datos al gdx del proceso
+    trabajador["datos"].write(trabajador["opt"].defines["gdxincname"])
+
+
+def obtener_instancias(df_dia):
+    """Devuelve las instancias de los dos modelos para los días con
+    tantas horas como df_dia, creándolas la primera vez. Las horas se
+    llaman "1", "2"... para que sirvan para cualquier día con ese
+    número de horas.
+    """
+    n_horas = len(df_dia.index)
+    if n_horas not in trabajador["instancias"]:
+        # Compila los modelos con los datos del día y guarda el
+        # estado en un checkpoint, del que salen las instancias
+        escribir_datos(df_dia, [str(h) for h in range(1, n_horas + 1)])
+        checkpoint = trabajador["ws"].add_checkpoint()
+        trabajador["modelo_sep"].run(
+            trabajador["opt"], checkpoint=checkpoint)
+
+        instancias = {}
+        for modelo, nombre_modelo in modelos_gams.items():
+            instancia = checkpoint.add_modelinstance()
+            modificadores = [
+                gams.GamsModifier(instancia.sync_db.add_parameter(nombre, 1))
+                for nombre in parametros_modificables
+            ]
+            instancia.instantiate(
+                nombre_modelo + " use mip max z", modificadores,
+                trabajador["opt"])
+            instancias[modelo] = instancia
+        trabajador["instancias"][n_horas] = instancias
+
+    return trabajador["instancias"][n_horas]
+
+
+def resolver_instancias(df_dia):
+    """Resuelve las instancias de los dos modelos con los datos de un
+    día cambiando sólo sus parámetros horarios. Devuelve lo mismo que
+    resolver_dia.
+    """
+    horas = df_dia.index.astype(str)
+    etiquetas = [str(h) for h in range(1, len(horas) + 1)]
+    parametros = modelo_brs.obtener_parametros(df_dia)
+
+    resultados = []
+    for modelo, instancia in obtener_instancias(df_dia).items():
+        for nombre in parametros_modificables:
+            parametro = instancia.sync_db[nombre]
+            parametro.clear()
+            for etiqueta, valor in zip(etiquetas, parametros[nombre]):
+                parametro.add_record(etiqueta).value = float(valor)
+        instancia.solve(mi_opt=trabajador["opciones_instancias"])
+        resultados.append(leer_resultados(instancia.sync_db, horas))
+    return tuple(resultados)
+
+
+def resolver_dia(df_dia):
+    """Resuelve los dos modelos con los datos de un día en el
+    WorkSpace del proceso actual. Devuelve una tupla con los
+    resultados de las centrales separadas y de las juntas.
+    """
+    if motor == "highs":
+        # Las centrales separadas se resuelven de forma exacta sin MIP
+        return (
+            modelo_brs.resolver_separadas(
+                df_dia, potencia_maxima, coste_fijo, coste_variable),
+            modelo_brs.resolver_modelo(
+                df_dia, potencia_maxima, coste_fijo, coste_variable,
+                agrupadas=True),
+        )
+
+    if instancias_modelo:
+        return resolver_instancias(df_dia)
+
+    escribir_datos(df_dia, df_dia.index.astype(str))
 
+    # Ejecuta el modelo con los datos de la base de datos
+    trabajador["modelo_sep"].run(trabajador["opt"])
+    trabajador["modelo_jun"].run(trabajador["opt"])
 
+    return (
+        leer_resultados(trabajador["modelo_sep"].out_db),
+        leer_resultados(trabajador["modelo_jun"].out_db),
+    )
 
 
+def guardar_resultados(fechas, resultados):
+    """Añade a los archivos de resultados los de cada día, en el
+    orden de las fechas.
+    """
+    inicio = True
+    mode = 'w'
+    for fecha, (df_opt_sep, df_opt_jun) in zip(fechas, resultados):
+
+        # Exporta los datos al archivo
+        df_opt_sep.to_csv(
+            carpeta_optimizacion + "optimizacion_separadas.csv",
+            mode=mode,header=inicio)
+        df_opt_jun.to_csv(
+            carpeta_optimizacion + "optimizacion_juntas.csv",
+            mode=mode,header=inicio)
+
+        inicio = False
+        mode = 'a'
+        print(fecha)
+
+
+if __name__ == "__main__":
+    # Importa los datos genéricos del mercado eléctrico
+    df_total = leer_datos_mercado(carpeta_datos + "tabla_datos_mercado.csv")
+    fechas = pd.date_range(start="2014",end="2018-12-31 23:00",freq="d")
+    dias = [df_total.loc[fecha.strftime("%Y-%m-%d")] for fecha in fechas]
+
+    # Bucle con la simulación de cada día para evitar sobrepasar
+    # el límite de la licencia. Los resultados se reciben en el
+    # orden de los días, terminen en el orden que terminen.
+    if procesos > 1:
+        with ProcessPoolExecutor(
+                max_workers=procesos,
+                initializer=iniciar_trabajador) as executor:
+            guardar_resultados(fechas, executor.map(resolver_dia, dias))
+    else:
+        iniciar_trabajador()
+        guardar_resultados(fechas, map(resolver_dia, dias))
+
+    print("El programa ha terminado.")
@@ -0,0 +1,294 @@
+"""
+Resolución en Python de los modelos de
+modelo_varias_centrales_sin_datos_separadas.gms (centrales_separadas)
+y modelo_varias_centrales_sin_datos_juntas.gms (centrales_agrupadas)
+sin necesidad de GAMS.
+
+Las ecuaciones de los modelos se escriben como una matriz dispersa
+de restricciones y se resuelven con el resolvedor MIP de código
+abierto HiGHS a través de scipy.optimize.milp. Se puede resolver
+cualquier número de horas a la vez, un día o varios.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+
+# Parámetros horarios de los modelos y columna de la tabla de datos
+# del mercado de la que se leen
+columnas_parametros = {
+    "pr_prog": "Precio mercado SPOT Diario",
+    "pr_brs": "Precio Banda de regulación secundaria",
+    "pr_ut_res_sub": "Precio de Regulación Secundaria subir",
+    "pr_ut_res_baj": "Precio de Regulación Secundaria bajar",
+    "requerimiento_brs_subir":
+        "Requerimientos Banda de regulación secundaria a subir",
+    "requerimiento_brs_bajar":
+        "Requerimientos Banda de regulación secundaria a bajar",
+    "utilizacion_reserva_bajar":
+        "Energía utilizada de Regulación Secundaria bajar",
+    "utilizacion_reserva_subir":
+        "Energía utilizada de Regulación Secundaria subir",
+}
+
+# Variables de cada central y hora en el orden en el que se guardan
+variables = [
+    "pot_prog", "brs_sub", "brs_baj", "brs_net_sub", "brs_net_baj",
+    "ut_neta_sub",
+]
+
+
+def obtener_parametros(df_horas):
+    """Devuelve un diccionario con los valores de cada parámetro
+    horario del modelo y los factores de utilización de la BRS
+    (fact_ut_sub y fact_ut_baj), calculados como en los modelos de
+    GAMS.
+    """
+    parametros = {
+        nombre: df_horas[columna].to_numpy(dtype=float)
+        for nombre, columna in columnas_parametros.items()
+    }
+    parametros["fact_ut_sub"] = np.minimum(
+        parametros["utilizacion_reserva_subir"]
+        / parametros["requerimiento_brs_subir"], 1)
+    parametros["fact_ut_baj"] = np.minimum(
+        parametros["utilizacion_reserva_bajar"]
+        / parametros["requerimiento_brs_bajar"], 1)
+    parametros["ratio"] = (
+        parametros["requerimiento_brs_subir"]
+        / parametros["requerimiento_brs_bajar"])
+    return parametros
+
+
+def calcular_beneficio(valores, parametros, pm, cf, cv):
+    """Devuelve el beneficio de cada hora (ben) de los valores de las
+    variables de cada central y hora.
+    """
+    ingresos = (
+        valores["pot_prog"] * parametros["pr_prog"]
+        + (valores["brs_baj"] + valores["brs_sub"]) * parametros["pr_brs"]
+        + valores["brs_net_sub"] * parametros["pr_ut_res_sub"]
+        - parametros["pr_ut_res_baj"] * valores["brs_net_baj"]
+    )
+    costes = cf * pm + cv * (
+        valores["pot_prog"] + valores["brs_net_sub"] - valores["brs_net_baj"])
+    return (ingresos - costes).sum(axis=0)
+
+
+def crear_tabla_resultados(valores, beneficio, centrales, horas):
+    """Devuelve los resultados con el mismo formato que los de GAMS
+    en full-time-optimisation.py: una fila por hora y una columna por
+    variable y central más el beneficio.
+    """
+    df_opt = pd.DataFrame(index=pd.Index(horas.astype(str)))
+    for prefijo, variable in [("p", "pot_prog"), ("brs_sub", "brs_sub"),
+                              ("brs_baj", "brs_baj")]:
+        for i, central in enumerate(centrales):
+            df_opt[prefijo + central] = valores[variable][i]
+    df_opt["ben"] = beneficio
+    return df_opt
+
+
+def resolver_separadas(df_horas, potencia_maxima, coste_fijo,
+                       coste_variable):
+    """Resuelve el modelo centrales_separadas de forma exacta para
+    todas las centrales y horas de df_horas a la vez, sin resolvedor
+    MIP. Devuelve lo mismo que resolver_modelo.
+
+    Con las centrales separadas cada central y hora es un problema
+    independiente. Como brs_sub = ratio * brs_baj, la utilización neta
+    es brs_baj * (ratio * fact_ut_sub - fact_ut_baj), cuyo signo sólo
+    depende de la hora y fija ut_neta_sub, con lo que queda un
+    problema lineal en pot_prog y brs_baj. Su óptimo está en uno de
+    los vértices (0, 0), (pm, 0) y (pm / (1 + ratio), pm / (1 + ratio))
+    de pot_prog + ratio * brs_baj <= pm, brs_baj <= pot_prog, y se
+    elige comparando el beneficio de los tres.
+
+    Keyword arguments:
+    df_horas -- dataframe con los datos del mercado de las horas a
+        resolver.
+    potencia_maxima -- diccionario con la potencia máxima de cada
+        central.
+    coste_fijo -- diccionario con el coste fijo de cada central.
+    coste_variable -- diccionario con el coste variable de cada
+        central.
+    """
+    centrales = list(potencia_maxima)
+    pm = np.array([potencia_maxima[c] for c in centrales], float)[:, None]
+    cf = np.array([coste_fijo[c] for c in centrales], float)[:, None]
+    cv = np.array([coste_variable[c] for c in centrales], float)[:, None]
+    parametros = obtener_parametros(df_horas)
+    ratio = parametros["ratio"]
+
+    # Utilización neta por MW de BRS a bajar y si es a subir
+    ut_neta = ratio * parametros["fact_ut_sub"] - parametros["fact_ut_baj"]
+    ut_neta_sub = ut_neta >= 0
+    precio_ut = np.where(
+        ut_neta_sub, parametros["pr_ut_res_sub"],
+        parametros["pr_ut_res_baj"])
+
+    # Beneficio por MW de pot_prog y de brs_baj, sin el coste fijo
+    coef_pot = parametros["pr_prog"] - cv
+    coef_baj = parametros["pr_brs"] * (1 + ratio) + (precio_ut - cv) * ut_neta
+
+    # Vértices (pot_prog, brs_baj) de cada central y hora
+    forma = np.broadcast(pm, ratio).shape
+    ceros = np.zeros(forma)
+    maximo = np.broadcast_to(pm, forma)
+    banda = pm / (1 + ratio)
+    vertices_pot = np.stack([ceros, maximo, banda])
+    vertices_baj = np.stack([ceros, ceros, banda])
+    mejor = np.argmax(
+        coef_pot * vertices_pot + coef_baj * vertices_baj, axis=0)[None]
+
+    pot_prog = np.take_along_axis(vertices_pot, mejor, axis=0)[0]
+    brs_baj = np.take_along_axis(vertices_baj, mejor, axis=0)[0]
+    neta = brs_baj * ut_neta
+    valores = {
+        "pot_prog": pot_prog,
+        "brs_sub": ratio * brs_baj,
+        "brs_baj": brs_baj,
+        "brs_net_sub": np.where(ut_neta_sub, neta, 0),
+        "brs_net_baj": np.where(ut_neta_sub, 0, -neta),
+        "ut_neta_sub": np.broadcast_to(ut_neta_sub, forma).astype(float),
+    }
+    beneficio = calcular_beneficio(valores, parametros, pm, cf, cv)
+    return crear_tabla_resultados(
+        valores, beneficio, centrales, df_horas.index)
+
+
+def resolver_modelo(df_horas, potencia_maxima, coste_fijo, coste_variable,
+                    agrupadas=False):
+    """Resuelve el modelo centrales_separadas (o centrales_agrupadas
+    si agrupadas es True) para las horas de df_horas con HiGHS.
+    Devuelve un dataframe con la potencia programada, la BRS a subir
+    y a bajar de cada central y el beneficio de cada hora.
+
+    Las variables auxiliares de los modelos de GAMS (ingresos,
+    costes, utilización) se sustituyen por su expresión, quedando
+    por central y hora pot_prog, brs_sub, brs_baj, brs_net_sub,
+    brs_net_baj y ut_neta_sub. En e_ut_brs_net_s y e_ut_brs_net_b se
+    usa como número grande la potencia máxima pm de cada central en
+    lugar del 1e6 de GAMS, con menos errores numéricos. No elimina
+    ninguna solución del modelo de GAMS: ut_neta_sub anula una de las
+    dos utilizaciones netas, así que por e_ut_brs_net la otra cumple
+    brs_net_sub <= fact_ut_sub * brs_sub <= brs_sub <= pm, ya que
+    fact_ut_sub <= 1 y pot_prog + brs_sub <= pm (e_pot_max), o
+    brs_net_baj <= fact_ut_baj * brs_baj <= brs_baj <= pot_prog <= pm
+    (e_pot_min y e_pot_max).
+
+    Keyword arguments:
+    df_horas -- dataframe con los datos del mercado de las horas a
+        resolver.
+    potencia_maxima -- diccionario con la potencia máxima de cada
+        central.
+    coste_fijo -- diccionario con el coste fijo de cada central.
+    coste_variable -- diccionario con el coste variable de cada
+        central.
+    agrupadas -- si es True el ratio entre la BRS a subir y a bajar
+        se cumple en el conjunto de las centrales (una sola Zona de
+        Regulación) y si es False en cada central.
+    """
+    from scipy.optimize import milp, Bounds, LinearConstraint
+    from scipy.sparse import coo_array
+
+    centrales = list(potencia_maxima)
+    pm = np.array([potencia_maxima[c] for c in centrales], float)[:, None]
+    cf = np.array([coste_fijo[c] for c in centrales], float)[:, None]
+    cv = np.array([coste_variable[c] for c in centrales], float)[:, None]
+    parametros = obtener_parametros(df_horas)
+    n_centrales = len(centrales)
+    n_horas = len(df_horas.index)
+    forma = (n_centrales, n_horas)
+
+    # Índice de cada variable de cada central y hora
+    indices = dict(zip(variables, np.arange(
+        len(variables) * n_centrales * n_horas
+    ).reshape(len(variables), n_centrales, n_horas)))
+
+    filas, columnas, coeficientes = [], [], []
+    limites_inferiores, limites_superiores = [], []
+
+    def agregar_restricciones(terminos, inferior, superior, por_zona=False):
+        # Añade una restricción por central y hora (o por hora si
+        # por_zona) con la suma de los términos (variable, coeficiente)
+        primera = sum(map(len, limites_inferiores))
+        n_filas = n_horas if por_zona else n_centrales * n_horas
+        filas_restriccion = primera + np.arange(n_filas)
+        if not por_zona:
+            filas_restriccion = filas_restriccion.reshape(forma)
+        for variable, coeficiente in terminos:
+            filas.append(np.broadcast_to(filas_restriccion, forma).ravel())
+            columnas.append(indices[variable].ravel())
+            coeficientes.append(
+                np.broadcast_to(coeficiente, forma).astype(float).ravel())
+        limites_inferiores.append(
+            np.broadcast_to(inferior, (n_filas,)).astype(float))
+        limites_superiores.append(
+            np.broadcast_to(superior, (n_filas,)).astype(float))
+
+    # e_pot_max y e_pot_min
+    agregar_restricciones(
+        [("pot_prog", 1), ("brs_sub", 1)], -np.inf,
+        np.broadcast_to(pm, forma).ravel())
+    agregar_restricciones([("pot_prog", 1), ("brs_baj", -1)], 0, np.inf)
+    # e_ratio_sub_baj_central o e_ratio_sub_baj_zona
+    agregar_restricciones(
+        [("brs_sub", 1), ("brs_baj", -parametros["ratio"])], 0, 0,
+        por_zona=agrupadas)
+    # e_ut_brs_net junto con e_ut_brs_sub y e_ut_brs_baj
+    agregar_restricciones(
+        [("brs_net_sub", 1), ("brs_net_baj", -1),
+         ("brs_sub", -parametros["fact_ut_sub"]),
+         ("brs_baj", parametros["fact_ut_baj"])],
+        0, 0)
+    # e_ut_brs_net_s y e_ut_brs_net_b
+    agregar_restricciones(
+        [("brs_net_sub", 1), ("ut_neta_sub", -pm)], -np.inf, 0)
+    agregar_restricciones(
+        [("brs_net_baj", 1), ("ut_neta_sub", pm)], -np.inf,
+        np.broadcast_to(pm, forma).ravel())
+
+    restricciones = LinearConstraint(
+        coo_array(
+            (np.concatenate(coeficientes),
+             (np.concatenate(filas), np.concatenate(columnas))),
+            shape=(sum(map(len, limites_inferiores)),
+                   len(variables) * n_centrales * n_horas),
+        ).tocsr(),
+        np.concatenate(limites_inferiores),
+        np.concatenate(limites_superiores),
+    )
+
+    # Función objetivo (e_fun_obj con e_ben, e_ing, e_cost y
+    # e_ing_hor_ut_brs), cambiada de signo para minimizar y sin el
+    # coste fijo, que no depende de las variables
+    objetivo = np.zeros((len(variables),) + forma)
+    objetivo[variables.index("pot_prog")] = parametros["pr_prog"] - cv
+    objetivo[variables.index("brs_sub")] = parametros["pr_brs"]
+    objetivo[variables.index("brs_baj")] = parametros["pr_brs"]
+    objetivo[variables.index("brs_net_sub")] = parametros["pr_ut_res_sub"] - cv
+    objetivo[variables.index("brs_net_baj")] = cv - parametros["pr_ut_res_baj"]
+
+    enteras = np.zeros((len(variables),) + forma)
+    enteras[variables.index("ut_neta_sub")] = 1
+    superiores = np.full((len(variables),) + forma, np.inf)
+    superiores[variables.index("ut_neta_sub")] = 1
+
+    resultado = milp(
+        -objetivo.ravel(),
+        integrality=enteras.ravel(),
+        bounds=Bounds(0, superiores.ravel()),
+        constraints=restricciones,
+    )
+    if not resultado.success:
+        raise RuntimeError(
+            "No se ha podido resolver el modelo: {}".format(
+                resultado.message))
+
+    valores = dict(zip(
+        variables, resultado.x.reshape((len(variables),) + forma)))
+    beneficio = calcular_beneficio(valores, parametros, pm, cf, cv)
+    return crear_tabla_resultados(
+        valores, beneficio, centrales, df_horas.index)
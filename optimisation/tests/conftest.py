@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Los scripts de optimisation importan modelo_brs como un módulo de
+# primer nivel, así que las pruebas lo importan de la misma forma.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,148 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import linprog
+
+import modelo_brs as m
+
+
+POTENCIA_MAXIMA = {"1": 10, "2": 20, "3": 15}
+COSTE_FIJO = {"1": 10, "2": 25, "3": 30}
+COSTE_VARIABLE = {"1": 40, "2": 15, "3": 5}
+
+# Número grande de e_ut_brs_net_s y e_ut_brs_net_b en los modelos de
+# GAMS (full-time-optimisation.py)
+NUMERO_GRANDE = 1e6
+
+
+def crear_horas(horas, generador):
+    columnas = list(m.columnas_parametros.values())
+    n = len(horas)
+    df_horas = pd.DataFrame(
+        {columna: generador.uniform(1, 80, n) for columna in columnas},
+        index=horas)
+    df_horas[columnas[4]] = generador.uniform(300, 900, n)
+    df_horas[columnas[5]] = generador.uniform(200, 700, n)
+    df_horas[columnas[6]] = generador.uniform(0, 400, n)
+    df_horas[columnas[7]] = generador.uniform(0, 400, n)
+    return df_horas
+
+
+def resolver_por_enumeracion(df_horas, agrupadas):
+    """Resuelve el modelo de GAMS, con su número grande, fijando cada
+    combinación de ut_neta_sub y resolviendo el problema lineal que
+    queda. Devuelve el beneficio de cada hora de la mejor.
+    """
+    parametros = m.obtener_parametros(df_horas)
+    pm = np.array(list(POTENCIA_MAXIMA.values()), float)
+    cf = np.array(list(COSTE_FIJO.values()), float)
+    cv = np.array(list(COSTE_VARIABLE.values()), float)
+    n_centrales, n_horas = len(pm), len(df_horas.index)
+    # pot_prog, brs_sub, brs_baj, brs_net_sub y brs_net_baj de cada
+    # central y hora
+    n_variables = 5 * n_centrales * n_horas
+
+    def indice(variable, i, t):
+        return (variable * n_centrales + i) * n_horas + t
+
+    objetivo = np.zeros(n_variables)
+    desigualdades, limites = [], []
+    igualdades = []
+    for i, t in itertools.product(range(n_centrales), range(n_horas)):
+        p = {nombre: parametros[nombre][t] for nombre in parametros}
+        objetivo[indice(0, i, t)] = p["pr_prog"] - cv[i]
+        objetivo[indice(1, i, t)] = p["pr_brs"]
+        objetivo[indice(2, i, t)] = p["pr_brs"]
+        objetivo[indice(3, i, t)] = p["pr_ut_res_sub"] - cv[i]
+        objetivo[indice(4, i, t)] = cv[i] - p["pr_ut_res_baj"]
+        # e_pot_max y e_pot_min
+        fila = np.zeros(n_variables)
+        fila[[indice(0, i, t), indice(1, i, t)]] = 1
+        desigualdades.append(fila)
+        limites.append(pm[i])
+        fila = np.zeros(n_variables)
+        fila[indice(0, i, t)] = -1
+        fila[indice(2, i, t)] = 1
+        desigualdades.append(fila)
+        limites.append(0)
+        # e_ut_brs_net con e_ut_brs_sub y e_ut_brs_baj
+        fila = np.zeros(n_variables)
+        fila[indice(3, i, t)] = 1
+        fila[indice(4, i, t)] = -1
+        fila[indice(1, i, t)] = -p["fact_ut_sub"]
+        fila[indice(2, i, t)] = p["fact_ut_baj"]
+        igualdades.append(fila)
+    # e_ratio_sub_baj_central o e_ratio_sub_baj_zona
+    for t in range(n_horas):
+        filas = [np.zeros(n_variables) for i in range(n_centrales)]
+        for i in range(n_centrales):
+            fila = filas[0] if agrupadas else filas[i]
+            fila[indice(1, i, t)] = 1
+            fila[indice(2, i, t)] = -parametros["ratio"][t]
+        igualdades.extend(filas[:1] if agrupadas else filas)
+
+    mejor = None
+    for ut_neta_sub in itertools.product(
+            [0, 1], repeat=n_centrales * n_horas):
+        # e_ut_brs_net_s y e_ut_brs_net_b con ut_neta_sub fijada
+        cotas = [(0, None)] * n_variables
+        for k, binaria in enumerate(ut_neta_sub):
+            i, t = divmod(k, n_horas)
+            cotas[indice(3, i, t)] = (0, NUMERO_GRANDE * binaria)
+            cotas[indice(4, i, t)] = (0, NUMERO_GRANDE * (1 - binaria))
+        resultado = linprog(
+            -objetivo, A_ub=np.array(desigualdades), b_ub=limites,
+            A_eq=np.array(igualdades), b_eq=np.zeros(len(igualdades)),
+            bounds=cotas)
+        assert resultado.success
+        if mejor is None or resultado.fun < mejor.fun:
+            mejor = resultado
+
+    beneficio_variable = (
+        objetivo * mejor.x).reshape(5, n_centrales, n_horas).sum(axis=(0, 1))
+    return beneficio_variable - (cf * pm).sum()
+
+
+@pytest.mark.parametrize("agrupadas", [False, True])
+def test_resolver_modelo_igual_que_enumerar_binarias(agrupadas):
+    horas = pd.date_range(
+        "2016-01-04", periods=2, freq="H", tz="Europe/Madrid")
+    df_horas = crear_horas(horas, np.random.default_rng(5))
+
+    df_opt = m.resolver_modelo(
+        df_horas, POTENCIA_MAXIMA, COSTE_FIJO, COSTE_VARIABLE,
+        agrupadas=agrupadas)
+
+    np.testing.assert_allclose(
+        df_opt["ben"].to_numpy(),
+        resolver_por_enumeracion(df_horas, agrupadas),
+        rtol=1e-9, atol=1e-6)
+
+
+def test_resolver_separadas_igual_que_resolver_modelo():
+    generador = np.random.default_rng(6)
+    # Un día de 23 horas y otro de 25
+    horas = pd.date_range(
+        "2016-03-27", periods=23, freq="H", tz="Europe/Madrid"
+    ).append(pd.date_range(
+        "2016-10-30", periods=25, freq="H", tz="Europe/Madrid"))
+    df_horas = crear_horas(horas, generador)
+    # Ratio casi nulo entre la BRS a subir y a bajar
+    df_horas.iloc[:6, 4] = 1e-6
+    # Precios de utilización nulos y horas sin utilización, en las que
+    # las dos ramas de ut_neta_sub dan el mismo beneficio
+    df_horas.iloc[6:12, [2, 3]] = 0
+    df_horas.iloc[12:18, [6, 7]] = 0
+
+    df_separadas = m.resolver_separadas(
+        df_horas, POTENCIA_MAXIMA, COSTE_FIJO, COSTE_VARIABLE)
+    df_modelo = m.resolver_modelo(
+        df_horas, POTENCIA_MAXIMA, COSTE_FIJO, COSTE_VARIABLE)
+
+    assert len(df_separadas.index) == 48
+    pd.testing.assert_index_equal(df_separadas.index, df_modelo.index)
+    pd.testing.assert_index_equal(df_separadas.columns, df_modelo.columns)
+    np.testing.assert_allclose(
+        df_separadas.to_numpy(), df_modelo.to_numpy(), rtol=0, atol=1e-6)
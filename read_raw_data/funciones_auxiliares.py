@@ -1,4 +1,9 @@
 import sys
+import json
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
 
 
 def print_progress(iteration, total, prefix='', suffix='', decimals=1, bar_length=50):
@@ -21,4 +26,189 @@ def print_progress(iteration, total, prefix='', suffix='', decimals=1, bar_lengt
 
     if iteration == total:
         sys.stdout.write('\n')
-    sys.stdout.flush()
\ No newline at end of file
+    sys.stdout.flush()
+
+# Time zone of every hourly index.
+ZONA_HORARIA = 'Europe/Madrid'
+
+
+@lru_cache(maxsize=None)
+def obtener_horas_dia(fecha):
+    """Return the hourly index of a day. It has 23 or 25 hours on the
+    days when daylight saving time starts or ends.
+
+    Keyword arguments:
+    fecha -- day as a 'YYYY-MM-DD' string
+    """
+    return pd.date_range(
+        start=fecha, end=fecha+' 23:00', freq='H', tz=ZONA_HORARIA)
+
+
+@lru_cache(maxsize=None)
+def obtener_calendario(start_date, end_date):
+    """Return the hourly index from the first hour of start_date to
+    the last hour of end_date. The positions of any hours in it, like
+    the slice of the hours of a day, are found at once with its
+    searchsorted method.
+
+    Keyword arguments:
+    start_date -- first day as a 'YYYY-MM-DD' string
+    end_date -- last day as a 'YYYY-MM-DD' string
+    """
+    return pd.date_range(
+        start=start_date, end=end_date+' 23:00', freq='H', tz=ZONA_HORARIA)
+
+
+def obtener_filas_horas_dia(n_filas, fecha):
+    """Return the positions of the rows of a day with n_filas hourly
+    rows that correspond to the hours of obtener_horas_dia(fecha).
+
+    Sheets with 24 rows on a 23 hour day leave out the third row (the
+    hour from 2:00 to 3:00, which does not exist that day). Sheets
+    with 25 rows on a 24 hour day leave out the last one. Any other
+    mismatch raises a ValueError instead of shifting the data.
+
+    Keyword arguments:
+    n_filas -- number of hourly rows of the day
+    fecha -- day as a 'YYYY-MM-DD' string
+    """
+    n_horas = len(obtener_horas_dia(fecha))
+    if n_filas == n_horas:
+        return np.arange(n_filas)
+    if n_filas == 24 and n_horas == 23:
+        return np.delete(np.arange(24), 2)
+    if n_filas == 25 and n_horas == 24:
+        return np.arange(24)
+    raise ValueError(
+        'The day {} has {} hours but the data has {} rows.'
+        .format(fecha, n_horas, n_filas))
+
+
+def alinear_horas_dia(df, fecha):
+    """Return the hourly rows of a day indexed by the hours of that
+    day, as described in obtener_filas_horas_dia.
+
+    Keyword arguments:
+    df -- dataframe with one row per hour of the day
+    fecha -- day as a 'YYYY-MM-DD' string
+    """
+    filas = obtener_filas_horas_dia(len(df), fecha)
+    if len(filas) != len(df):
+        df = df.iloc[filas]
+    return df.set_axis(obtener_horas_dia(fecha), axis=0)
+
+
+def convertir_indice_horario(indice):
+    """Convert an index read from a csv file with UTC offsets (like
+    '2014-01-01 00:00:00+01:00') to the hourly time zone aware index.
+    The conversion uses every timestamp, so hours are not shifted if
+    some of them are missing.
+    """
+    return pd.DatetimeIndex(
+        pd.to_datetime(indice, utc=True)).tz_convert(ZONA_HORARIA)
+
+
+# Separator used to flatten multiindex column names in Parquet files.
+SEPARADOR_COLUMNAS = '|'
+
+# Hours stored in every row group of the columnar tables. Row groups
+# keep the first and last hour they store, so reading a period of
+# time skips the row groups outside of it.
+FILAS_GRUPO_COLUMNAR = 24*31
+
+
+def guardar_tabla_columnar(df, ruta):
+    """Store a dataframe with a datetime index and multiindex columns
+    in a Parquet file. Every column is stored on its own, so it can be
+    read later without reading the rest of the table. The time zone of
+    the index is kept. Column labels cannot contain
+    SEPARADOR_COLUMNAS, as it separates the levels of every name.
+
+    Keyword arguments:
+    df -- dataframe to store
+    ruta -- path of the Parquet file
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for columna in df.columns:
+        if any(SEPARADOR_COLUMNAS in str(valor) for valor in columna):
+            raise ValueError(
+                'The column {} contains "{}", which separates the levels '
+                'of the columns in the Parquet file.'
+                .format(columna, SEPARADOR_COLUMNAS))
+
+    df_plano = df.copy(deep=False)
+    df_plano.columns = [
+        SEPARADOR_COLUMNAS.join(str(valor) for valor in columna)
+        for columna in df.columns
+    ]
+    df_plano.insert(0, 'Hora', df.index)
+    tabla = pa.Table.from_pandas(df_plano, preserve_index=False)
+    metadatos = dict(tabla.schema.metadata or {})
+    metadatos[b'niveles_columnas'] = json.dumps(
+        list(df.columns.names)).encode()
+    pq.write_table(
+        tabla.replace_schema_metadata(metadatos), ruta,
+        row_group_size=FILAS_GRUPO_COLUMNAR,
+    )
+
+
+def leer_tabla_columnar(ruta, seleccion=None, inicio=None, fin=None):
+    """Read a table stored with guardar_tabla_columnar. Only the
+    columns selected and the hours between inicio and fin are read
+    from the file. Return a dataframe with the same datetime index and
+    multiindex columns it was stored with.
+
+    Keyword arguments:
+    ruta -- path of the Parquet file
+    seleccion -- list with, for every column level, a list of the
+        values to read or None to read all of them. Everything is read
+        if None.
+    inicio -- first hour to read (from the first hour if None).
+    fin -- hour after the last one to read (until the last hour if
+        None).
+    """
+    import pyarrow.parquet as pq
+
+    esquema = pq.read_schema(ruta)
+    nombres_niveles = json.loads(esquema.metadata[b'niveles_columnas'])
+    columnas = [nombre for nombre in esquema.names if nombre != 'Hora']
+    if seleccion is not None:
+        columnas = [
+            columna for columna in columnas
+            if all(
+                valores is None or valor in valores
+                for valor, valores in zip(
+                    columna.split(SEPARADOR_COLUMNAS), seleccion)
+            )
+        ]
+    filtros = []
+    if inicio is not None:
+        filtros.append(('Hora', '>=', pd.Timestamp(inicio)))
+    if fin is not None:
+        filtros.append(('Hora', '<', pd.Timestamp(fin)))
+    tabla = pq.read_table(
+        ruta, columns=['Hora'] + columnas, memory_map=True,
+        filters=filtros or None,
+    )
+    df = tabla.to_pandas()
+    df.index = pd.DatetimeIndex(df.pop('Hora'))
+    df.columns = pd.MultiIndex.from_tuples(
+        [tuple(columna.split(SEPARADOR_COLUMNAS)) for columna in columnas],
+        names=nombres_niveles,
+    )
+    return df
+
+
+def leer_horas_tabla_columnar(ruta):
+    """Return the hours of a table stored with guardar_tabla_columnar,
+    reading only its index.
+
+    Keyword arguments:
+    ruta -- path of the Parquet file
+    """
+    import pyarrow.parquet as pq
+
+    tabla = pq.read_table(ruta, columns=['Hora'], memory_map=True)
+    return pd.DatetimeIndex(tabla.column('Hora').to_pandas())
@@ -0,0 +1,221 @@
+from concurrent.futures import (
+    ThreadPoolExecutor, wait, FIRST_COMPLETED)
+import os
+
+import funciones_procesado as f
+
+
+# Files where procesado_datos.py saves every output node computed
+# when no table is requested.
+ARCHIVOS_SALIDA = {
+    'df_corr_empresas': 'correlaciones_empresas.csv',
+    'df_corr_centrales': 'correlaciones_centrales.csv',
+}
+
+# Files of the windowed correlation nodes, only computed and saved
+# when they are requested by name.
+ARCHIVOS_SALIDA_VENTANAS = {
+    'df_corr_mensual_empresas': 'correlaciones_mensuales_empresas.csv',
+    'df_corr_movil_empresas': 'correlaciones_30_dias_empresas.csv',
+}
+
+
+def obtener_ancestros(grafo, objetivos, calculados=()):
+    """Return the set with the nodes passed and every node they depend
+    on, directly or through other nodes, leaving out the nodes already
+    computed and the nodes only they depend on.
+
+    Keyword arguments:
+    grafo -- dictionary with the name of every node as key and a tuple
+        (function, list of names of the nodes whose values are passed
+        to the function) as value.
+    objetivos -- list of names of the nodes requested.
+    calculados -- names of the nodes already computed.
+    """
+    ancestros = set()
+    pendientes = list(objetivos)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre in ancestros or nombre in calculados:
+            continue
+        if nombre not in grafo:
+            raise KeyError('Unknown node "{}".'.format(nombre))
+        ancestros.add(nombre)
+        pendientes.extend(grafo[nombre][1])
+    return ancestros
+
+
+def calcular_nodos(grafo, objetivos, valores=None, hilos=1):
+    """Compute the nodes requested and only the nodes they depend on.
+    Return the dictionary with the values of every node computed so
+    far, which can be passed again to reuse them.
+
+    With more than one thread, nodes whose dependencies are already
+    computed run at the same time in a pool of threads, so independent
+    branches of the graph do not wait for each other. Nodes that start
+    their own worker processes, like the correlations with
+    significance, are better run one at a time.
+
+    Keyword arguments:
+    grafo -- dictionary with the name of every node as key and a tuple
+        (function, list of names of the nodes whose values are passed
+        to the function) as value.
+    objetivos -- list of names of the nodes requested.
+    valores -- dictionary with the values of the nodes already
+        computed, which are not computed again.
+    hilos -- maximum number of nodes computed at the same time (as
+        many as processors if None).
+    """
+    valores = {} if valores is None else valores
+    pendientes = obtener_ancestros(grafo, objetivos, valores)
+
+    with ThreadPoolExecutor(max_workers=hilos or os.cpu_count()) as executor:
+        en_curso = {}
+        while pendientes or en_curso:
+            preparados = [
+                nombre for nombre in pendientes
+                if all(dependencia in valores
+                       for dependencia in grafo[nombre][1])
+            ]
+            for nombre in preparados:
+                funcion, dependencias = grafo[nombre]
+                futuro = executor.submit(
+                    funcion, *[valores[dependencia]
+                               for dependencia in dependencias])
+                en_curso[futuro] = nombre
+                pendientes.remove(nombre)
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                valores[en_curso.pop(futuro)] = futuro.result()
+
+    return valores
+
+
+def crear_grafo_procesado(carpeta_de_informacion,
+                          carpeta_de_datos_centrales,
+                          opciones_significacion=None, dispersa=False):
+    """Return the graph of the processing stage, with a node for every
+    table that procesado_datos.py obtains. Every node is named after
+    the variable the script used to keep it.
+
+    Keyword arguments:
+    carpeta_de_informacion -- path to the processed information.
+    carpeta_de_datos_centrales -- path to the Unidad de Programación
+        data.
+    opciones_significacion -- keyword arguments of
+        obtener_correlaciones used to compute the significance of the
+        correlations (not computed if None).
+    dispersa -- if True, the impossible MW and hours and the extra
+        profit are stored as pandas sparse columns.
+    """
+    opciones_significacion = opciones_significacion or {}
+
+    def mw_imposibles(df_marg_pot):
+        return f.obtener_mw_imposibles(df_marg_pot, dispersa)
+
+    def horas_imposibles(df_marg_pot):
+        return f.obtener_horas_imposibles(df_marg_pot, dispersa)
+
+    def correlaciones(df_mercado, *dataframes):
+        return f.obtener_correlaciones(
+            df_mercado,
+            dict(zip(f.NOMBRES_CORRELACIONES, dataframes)),
+            **opciones_significacion,
+        )
+
+    def correlaciones_ventana(ventana):
+        def calcular(df_mercado, *dataframes):
+            return f.obtener_correlaciones_ventana(
+                df_mercado,
+                dict(zip(f.NOMBRES_CORRELACIONES, dataframes)),
+                ventana=ventana,
+            )
+        return calcular
+
+    datos_empresas = [
+        'df_mw_imposibles_empresas',
+        'df_horas_imposibles_empresas',
+        'df_ben_extra_empresas',
+    ]
+    datos_centrales = [
+        'df_mw_imposibles_centrales',
+        'df_horas_imposibles_centrales',
+        'df_ben_extra_centrales',
+    ]
+
+    return {
+        'participantes_secundaria': (
+            lambda: f.leer_participantes_secundaria(carpeta_de_informacion),
+            [],
+        ),
+        'datos_centrales': (
+            lambda participantes_secundaria: f.obtener_empresa_centrales(
+                participantes_secundaria, carpeta_de_datos_centrales),
+            ['participantes_secundaria'],
+        ),
+        'centrales_en_empresa': (
+            lambda datos_centrales: datos_centrales[0],
+            ['datos_centrales'],
+        ),
+        'empresa_de_central': (
+            lambda datos_centrales: datos_centrales[1],
+            ['datos_centrales'],
+        ),
+        'df_potencias': (
+            lambda: f.leer_tabla_potencia(carpeta_de_informacion),
+            [],
+        ),
+        'df_margenes_potencia': (
+            lambda df_potencias: f.obtener_margenes_potencia(
+                df_potencias, carpeta_de_informacion),
+            ['df_potencias'],
+        ),
+        'df_margenes_potencia_empresas': (
+            lambda df_margenes_potencia, centrales_en_empresa: (
+                f.obtener_margenes_potencia_empresas(
+                    df_margenes_potencia, centrales_en_empresa,
+                    carpeta_de_informacion)),
+            ['df_margenes_potencia', 'centrales_en_empresa'],
+        ),
+        'df_mw_imposibles_centrales': (
+            mw_imposibles,
+            ['df_margenes_potencia'],
+        ),
+        'df_mw_imposibles_empresas': (
+            mw_imposibles,
+            ['df_margenes_potencia_empresas'],
+        ),
+        'df_horas_imposibles_centrales': (
+            horas_imposibles,
+            ['df_margenes_potencia'],
+        ),
+        'df_horas_imposibles_empresas': (
+            horas_imposibles,
+            ['df_margenes_potencia_empresas'],
+        ),
+        'df_mercado': (
+            lambda: f.leer_tabla_mercado(carpeta_de_informacion),
+            [],
+        ),
+        'df_ben_extra_centrales': (
+            f.obtener_beneficio_extra,
+            ['df_mw_imposibles_centrales', 'df_mercado'],
+        ),
+        'df_ben_extra_empresas': (
+            f.obtener_beneficio_extra,
+            ['df_mw_imposibles_empresas', 'df_mercado'],
+        ),
+        'df_corr_empresas': (
+            correlaciones, ['df_mercado'] + datos_empresas,
+        ),
+        'df_corr_centrales': (
+            correlaciones, ['df_mercado'] + datos_centrales,
+        ),
+        'df_corr_mensual_empresas': (
+            correlaciones_ventana('M'), ['df_mercado'] + datos_empresas,
+        ),
+        'df_corr_movil_empresas': (
+            correlaciones_ventana(30), ['df_mercado'] + datos_empresas,
+        ),
+    }
+
@@ -3,9 +3,290 @@ import numpy as np
 import sys
 import fnmatch
 import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pandas.api.types import union_categoricals
 idx = pd.IndexSlice
 
-from funciones_auxiliares import print_progress
+from funciones_auxiliares import (
+    print_progress, obtener_horas_dia, obtener_filas_horas_dia,
+    alinear_horas_dia, obtener_calendario, ZONA_HORARIA)
+
+
+# Sheets of the I90DIA workbooks used in the study and the arguments
+# needed to parse each of them:
+# 1 -- 'Programa Viable Provisional' (PVP).
+# 2 -- 'Programa P48'.
+# 5 -- BRS selected biddings.
+# 13 -- BRS biddings.
+HOJAS_I90DIA = {
+    1: {'skiprows': 3, 'header': 0},
+    2: {'skiprows': 3, 'header': 0},
+    5: {'skiprows': 2, 'header': 0},
+    13: {'skiprows': 2, 'header': 0},
+}
+
+# Version of the way the sheets are parsed. It is part of the key of
+# every cached sheet, so it must be increased whenever HOJAS_I90DIA
+# or leer_hojas_i90dia change to discard the sheets already cached.
+VERSION_CACHE_I90DIA = 1
+
+
+def obtener_fecha_archivo(file):
+    """Return the date of an I90DIA file as a 'YYYY-MM-DD' string.
+
+    Keyword arguments:
+    file -- name of the I90DIA file (I90DIA_YYYYMMDD.xls)
+    """
+    string_fecha = file[7:15]
+    return (
+        string_fecha[:4] + '-'
+        + string_fecha[4:6] + '-'
+        + string_fecha[6:])
+
+
+def obtener_hash_archivo(ruta):
+    """Return the SHA-1 hash of the content of a file."""
+    hash_archivo = hashlib.sha1()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            hash_archivo.update(bloque)
+    return hash_archivo.hexdigest()
+
+
+def obtener_ruta_cache(carpeta_cache, hash_archivo, hoja):
+    """Return the path of the cached copy of a sheet. The name depends
+    on the content of the workbook, the sheet, the arguments used to
+    parse it and VERSION_CACHE_I90DIA.
+    """
+    clave = '{}|{}|{}|{}'.format(
+        hash_archivo, hoja, sorted(HOJAS_I90DIA[hoja].items()),
+        VERSION_CACHE_I90DIA,
+    )
+    return (carpeta_cache
+            + hashlib.sha1(clave.encode()).hexdigest() + '.pkl')
+
+
+def leer_hojas_i90dia(carpeta, file, hojas=None, carpeta_cache=None):
+    """Open an I90DIA workbook only once and parse the requested
+    sheets from it. Return a dictionary with the sheet number as key
+    and the parsed dataframe as value.
+
+    If a cache folder is passed, the parsed sheets are stored there
+    and the workbook is only opened when some of the requested sheets
+    is not cached yet.
+
+    Keyword arguments:
+    carpeta -- path to the documents with raw data (I90DIA)
+    file -- name of the I90DIA file to read
+    hojas -- list of sheet numbers to parse (all sheets in
+        HOJAS_I90DIA by default)
+    carpeta_cache -- path to the folder with the cached sheets (no
+        cache is used if None)
+    """
+    if hojas is None:
+        hojas = list(HOJAS_I90DIA.keys())
+    dic_hojas = dict()
+    rutas_cache = dict()
+    if carpeta_cache is not None:
+        hash_archivo = obtener_hash_archivo(carpeta + file)
+        for hoja in hojas:
+            rutas_cache[hoja] = obtener_ruta_cache(
+                carpeta_cache, hash_archivo, hoja)
+            if os.path.isfile(rutas_cache[hoja]):
+                dic_hojas[hoja] = pd.read_pickle(rutas_cache[hoja])
+                # The modification time records the last use of the
+                # sheet for limitar_cache.
+                os.utime(rutas_cache[hoja])
+
+    hojas_pendientes = [hoja for hoja in hojas if hoja not in dic_hojas]
+    if hojas_pendientes:
+        with pd.ExcelFile(carpeta + file) as libro:
+            for hoja in hojas_pendientes:
+                dic_hojas[hoja] = libro.parse(
+                    sheet_name=hoja, **HOJAS_I90DIA[hoja])
+                if carpeta_cache is not None:
+                    # Write to a temporary file first so that other
+                    # processes never read a half written sheet.
+                    ruta_temporal = '{}.{}.tmp'.format(
+                        rutas_cache[hoja], os.getpid())
+                    dic_hojas[hoja].to_pickle(ruta_temporal)
+                    os.replace(ruta_temporal, rutas_cache[hoja])
+    return dic_hojas
+
+
+def limitar_cache(carpeta_cache, tamano_maximo):
+    """Remove the least recently used sheets of the cache until its
+    size is below the limit passed.
+
+    Keyword arguments:
+    carpeta_cache -- path to the folder with the cached sheets
+    tamano_maximo -- maximum size of the cache in bytes
+    """
+    archivos = []
+    for file in fnmatch.filter(os.listdir(carpeta_cache), '*.pkl'):
+        estado = os.stat(carpeta_cache + file)
+        archivos.append((estado.st_mtime, estado.st_size, file))
+    archivos.sort()
+    tamano_total = sum(archivo[1] for archivo in archivos)
+    for _, tamano, file in archivos:
+        if tamano_total <= tamano_maximo:
+            break
+        os.remove(carpeta_cache + file)
+        tamano_total -= tamano
+
+
+def limpiar_cache(carpeta_cache):
+    """Remove every sheet stored in the cache, for example after
+    changing the way the sheets are parsed.
+
+    Keyword arguments:
+    carpeta_cache -- path to the folder with the cached sheets
+    """
+    limitar_cache(carpeta_cache, 0)
+
+
+def procesar_ofertantes_dia(df_hoja):
+    """Return the set of BRS bidders found in sheet 13 of a day."""
+    return set(df_hoja['Unidad de Programación'].unique())
+
+
+def procesar_programa_dia(df_hoja, fecha, participantes_secundaria=None):
+    """Turn sheet 1 (PVP) or sheet 2 (P48) of a day into an hourly
+    dataframe with one column per Unidad de Programación.
+
+    Keyword arguments:
+    df_hoja -- parsed sheet of the I90DIA file
+    fecha -- date of the file as a 'YYYY-MM-DD' string
+    participantes_secundaria -- list of power units to keep (all of
+        them if None)
+    """
+    df_temporal = df_hoja
+    if participantes_secundaria is not None:
+        df_temporal = (
+            df_temporal.loc[df_temporal['Unidad de Programación']
+                            .isin(participantes_secundaria)])
+    df_temporal = (df_temporal.set_index(['Unidad de Programación'])
+                   .drop(columns=['Tipo Oferta', 'Hora', 'Total'])
+                   .fillna(0).transpose())
+    return alinear_horas_dia(df_temporal, fecha)
+
+
+# Key columns of the detailed BRS biddings and the compact types used
+# to store them.
+COLUMNAS_OFERTAS_DETALLADAS = {
+    'Unidad de Programación': 'category',
+    'Sentido': 'category',
+    'Nº Oferta': 'int32',
+    'Bloque': 'int32',
+}
+
+
+def procesar_brs_ofertada_dia(df_hoja, fecha):
+    """Turn sheet 13 of a day into a tuple of 2 dataframes and a
+    fragment of the detailed biddings: (biddings to increase power,
+    biddings to decrease power, detailed biddings). The fragment is a
+    dictionary of arrays to be merged with crear_tabla_ofertas_detalladas.
+
+    Keyword arguments:
+    df_hoja -- parsed sheet 13 of the I90DIA file
+    fecha -- date of the file as a 'YYYY-MM-DD' string
+    """
+    columns_to_drop = [('€/MWh.' + str(num)) for num in range(1,25)]
+    columns_to_drop.extend(['€/MWh', 'Bloque', 'Nº Oferta',
+                            'Tipo Oferta', 'Indicadores', 'Total MW',
+                            'PMP €/MWh', 'Divisibilad'])
+
+    df_temporal = df_hoja.drop(columns=columns_to_drop, errors='ignore')
+    df_temporal = (
+        df_temporal.fillna(0)
+        .groupby(by=['Sentido', 'Unidad de Programación']).sum())
+    df_temporal_subir = df_temporal.loc['Subir'].transpose()
+    df_temporal_bajar = df_temporal.loc['Bajar'].transpose()
+    df_temporal_subir = alinear_horas_dia(df_temporal_subir, fecha)
+    df_temporal_bajar = alinear_horas_dia(df_temporal_bajar, fecha)
+
+    # Every hour has a pair of columns (MW, €/MWh) after the keys.
+    df_valores = df_hoja.drop(
+        columns=['Tipo Oferta', 'Indicadores', 'Total MW', 'PMP €/MWh',
+                 'Divisibilad'] + list(COLUMNAS_OFERTAS_DETALLADAS),
+        errors='ignore')
+    filas_horas = obtener_filas_horas_dia(df_valores.shape[1] // 2, fecha)
+    valores = (
+        df_valores.iloc[
+            :, np.column_stack([2*filas_horas, 2*filas_horas+1]).ravel()]
+        .to_numpy(dtype=np.float32)
+        .reshape(len(df_valores), len(filas_horas), 2)
+    )
+    # Only the hours with some data of every bidding block are kept.
+    filas, horas = np.nonzero(~np.isnan(valores).all(axis=2))
+    fragmento_ofertas = {
+        'Hora': obtener_horas_dia(fecha).asi8[horas],
+        'MW': valores[filas, horas, 0],
+        '€/MWh': valores[filas, horas, 1],
+    }
+    for columna, tipo in COLUMNAS_OFERTAS_DETALLADAS.items():
+        if tipo == 'category':
+            fragmento_ofertas[columna] = pd.Categorical(
+                df_hoja[columna].to_numpy()[filas])
+        else:
+            fragmento_ofertas[columna] = (
+                pd.to_numeric(df_hoja[columna]).fillna(0)
+                .to_numpy().astype(tipo)[filas])
+
+    return df_temporal_subir, df_temporal_bajar, fragmento_ofertas
+
+
+def crear_tabla_ofertas_detalladas(fragmentos):
+    """Merge the fragments of detailed BRS biddings returned by
+    procesar_brs_ofertada_dia into a single dataframe with a row per
+    Unidad de Programación, direction, bidding, block and hour. Every
+    column is built with a single concatenation and stored with a
+    compact type: categories for the Unidades de Programación and the
+    direction, 32 bit integers for biddings and blocks and float32
+    for MW and €/MWh.
+
+    Keyword arguments:
+    fragmentos -- list of fragments in date order
+    """
+    columnas = dict()
+    for columna, tipo in COLUMNAS_OFERTAS_DETALLADAS.items():
+        if tipo == 'category':
+            columnas[columna] = union_categoricals(
+                [fragmento[columna] for fragmento in fragmentos],
+                sort_categories=True)
+        else:
+            columnas[columna] = np.concatenate(
+                [fragmento[columna] for fragmento in fragmentos])
+    columnas['Hora'] = pd.DatetimeIndex(
+        np.concatenate([fragmento['Hora'] for fragmento in fragmentos]),
+        tz='UTC',
+    ).tz_convert(ZONA_HORARIA)
+    for columna in ['MW', '€/MWh']:
+        columnas[columna] = np.concatenate(
+            [fragmento[columna] for fragmento in fragmentos])
+    return pd.DataFrame(columnas)
+
+
+def procesar_brs_casada_dia(df_hoja, fecha):
+    """Turn sheet 5 of a day into a tuple of 2 dataframes:
+    (selected biddings to increase power, selected biddings to
+    decrease power).
+
+    Keyword arguments:
+    df_hoja -- parsed sheet 5 of the I90DIA file
+    fecha -- date of the file as a 'YYYY-MM-DD' string
+    """
+    columns_to_drop = [
+        'Nm Oferta asignada', 'Tipo Oferta', 'Hora', 'Total']
+    df_temporal = df_hoja.drop(columns=columns_to_drop, errors='ignore')
+    df_temporal = df_temporal.groupby(by=['Sentido', 'Unidad de Programación']).sum()
+    df_temporal_subir = df_temporal.loc['Subir'].transpose()
+    df_temporal_bajar = df_temporal.loc['Bajar'].transpose()
+
+    df_temporal_subir = alinear_horas_dia(df_temporal_subir, fecha)
+    df_temporal_bajar = alinear_horas_dia(df_temporal_bajar, fecha)
+    return df_temporal_subir, df_temporal_bajar
 
 
 def obtener_ofertantes_secundaria(carpeta,files_list):
@@ -25,17 +306,9 @@ def obtener_ofertantes_secundaria(carpeta,files_list):
     )
 
     for i, file in enumerate(files_list):
-        name = carpeta + file
-        df_temporal = pd.read_excel(
-            io=name,
-            sheet_name=13,
-            skiprows=2,
-            header=0,
-            usecols=['Unidad de Programación'],
-        )
-        ofertantes_dia = (
-            set(df_temporal['Unidad de Programación'].unique()))
-        ofertantes_totales = ofertantes_totales.union(ofertantes_dia)
+        df_temporal = leer_hojas_i90dia(carpeta, file, hojas=[13])[13]
+        ofertantes_totales = ofertantes_totales.union(
+            procesar_ofertantes_dia(df_temporal))
         print_progress(
             i+1, l, prefix='Creating BRS bidders list:',
             suffix='Complete',
@@ -62,30 +335,10 @@ def obtener_pvp(participantes_secundaria, carpeta, files_list):
         suffix='Complete')
 
     for i, file in enumerate(files_list):
-        name = carpeta + file
-        df_temporal = pd.read_excel(
-            io=name,
-            sheet_name=1,
-            skiprows=3,
-            header=0)
-        df_temporal = (
-            df_temporal.loc[df_temporal['Unidad de Programación']
-                            .isin(participantes_secundaria)])
-        df_temporal = (df_temporal.set_index(['Unidad de Programación'])
-                       .drop(columns=['Tipo Oferta', 'Hora', 'Total'])
-                       .fillna(0).transpose())
-        string_fecha = file[7:15]
-        string_fecha_completa = (
-            string_fecha[:4] + '-' 
-            + string_fecha[4:6] + '-' 
-            + string_fecha[6:])
-        df_temporal.set_index(
-            pd.date_range(
-                start=string_fecha_completa,
-                end=string_fecha_completa+' 23:00',
-                freq='H',tz='Europe/Madrid'),
-            inplace=True)
-        lista_dataframes_temporales.append(df_temporal)
+        df_temporal = leer_hojas_i90dia(carpeta, file, hojas=[1])[1]
+        lista_dataframes_temporales.append(procesar_programa_dia(
+            df_temporal, obtener_fecha_archivo(file),
+            participantes_secundaria))
         print_progress(i+1, l, prefix='Importing PVP power:',
             suffix='Complete')
 
@@ -100,8 +353,9 @@ def obtener_pvp(participantes_secundaria, carpeta, files_list):
 def obtener_brs_ofertada(carpeta, files_list):
     """Obtain 'Banda de Regulación Secundaria' biddings for the
     period covered in the files for all power units involved and
-    return a tuple of 2 dataframes: (biddings to increase power,
-    biddings to decrease power).
+    return a tuple of 3 dataframes: (biddings to increase power,
+    biddings to decrease power, detailed biddings as returned by
+    crear_tabla_ofertas_detalladas).
 
     Keyword arguments:
     carpeta -- path to the documents with raw data (I90DIA)
@@ -110,76 +364,18 @@ def obtener_brs_ofertada(carpeta, files_list):
     lista_dataframes_temporales_subir = []
     lista_dataframes_temporales_bajar = []
     lista_dataframes_temporales_detalle = []
-    df_potencia_brs_subir = pd.DataFrame()
-    df_potencia_brs_bajar = pd.DataFrame()
-    df_ofertas_detallado = pd.DataFrame()
     # Progress bar
     l=len(files_list)
     print_progress(0, l, prefix='Importing BRS biddings:', 
         suffix='Complete')
 
-    columns_to_drop = [('€/MWh.' + str(num)) for num in range(1,25)]
-    columns_to_drop.extend(['€/MWh', 'Bloque', 'Nº Oferta',
-                            'Tipo Oferta', 'Indicadores', 'Total MW',
-                            'PMP €/MWh', 'Divisibilad'])
-
     for i, file in enumerate(files_list):
-        name = carpeta + file
-        df_temporal = pd.read_excel(
-            io=name,
-            sheet_name=13,
-            skiprows=1,
-            header=1)
-        df_temporal_ofertas = df_temporal.copy()
-
-        df_temporal.drop(
-            columns=columns_to_drop, inplace=True, errors='ignore')
-        df_temporal.fillna(0, inplace=True)
-        df_temporal = (
-            df_temporal.groupby(by=['Sentido', 'Unidad de Programación'])
-            .sum().copy())
-        df_temporal_subir = df_temporal.loc['Subir']
-        df_temporal_bajar = df_temporal.loc['Bajar']
-        df_temporal_subir = df_temporal_subir.transpose().copy()
-        df_temporal_bajar = df_temporal_bajar.transpose().copy()
-        
-        string_fecha = file[7:15]
-        string_fecha_completa = (
-            string_fecha[:4] + '-' 
-            + string_fecha[4:6] + '-' 
-            + string_fecha[6:])
-        
-        df_temporal_ofertas.drop(
-            columns=['Tipo Oferta', 'Indicadores', 'Total MW', 'PMP €/MWh', 'Divisibilad'], 
-            inplace=True, errors='ignore')
-        df_temporal_ofertas.set_index(
-            keys=['Unidad de Programación', 'Sentido', 'Nº Oferta', 'Bloque'],
-            drop=True, inplace=True
-        )
-        df_temporal_ofertas.columns=pd.MultiIndex.from_product(
-            iterables=[
-                pd.date_range(
-                    start=string_fecha_completa,
-                    end=string_fecha_completa+' 23:00',
-                    freq='H',tz='Europe/Madrid'
-                ),
-                ['MW','€/MWh']],
-            names=['Hora', 'Dato'])
-        df_temporal_ofertas = df_temporal_ofertas.stack('Hora')
+        df_temporal = leer_hojas_i90dia(carpeta, file, hojas=[13])[13]
+        (df_temporal_subir,
+         df_temporal_bajar,
+         df_temporal_ofertas) = procesar_brs_ofertada_dia(
+            df_temporal, obtener_fecha_archivo(file))
         lista_dataframes_temporales_detalle.append(df_temporal_ofertas)
-        
-        df_temporal_subir.set_index(
-            pd.date_range(
-                start=string_fecha_completa,
-                end=string_fecha_completa+' 23:00',
-                freq='H',tz='Europe/Madrid'),
-            inplace=True)
-        df_temporal_bajar.set_index(
-            pd.date_range(
-                start=string_fecha_completa,
-                end=string_fecha_completa+' 23:00',
-                freq='H',tz='Europe/Madrid'),
-            inplace=True)
         lista_dataframes_temporales_subir.append(df_temporal_subir)
         lista_dataframes_temporales_bajar.append(df_temporal_bajar)
         print_progress(i+1, l, prefix='Importing BRS biddings:', 
@@ -191,9 +387,8 @@ def obtener_brs_ofertada(carpeta, files_list):
     df_potencia_brs_bajar = pd.concat(
         lista_dataframes_temporales_bajar, axis=0,
         join='outer', sort=False)
-    df_ofertas_detallado = pd.concat(
-        lista_dataframes_temporales_detalle, axis=0,
-        join='outer', sort=False)
+    df_ofertas_detallado = crear_tabla_ofertas_detalladas(
+        lista_dataframes_temporales_detalle)
     
     df_potencia_brs_subir.fillna(0, inplace=True)
     df_potencia_brs_bajar.fillna(0, inplace=True)
@@ -206,45 +401,15 @@ def obtener_brs_ofertada(carpeta, files_list):
 def obtener_brs_casada(carpeta, files_list):
     lista_casada_subir = []
     lista_casada_bajar = []
-    columns_to_drop = [
-        'Nm Oferta asignada', 'Tipo Oferta', 'Hora', 'Total']
     # Progress bar
     l=len(files_list)
     print_progress(0, l, prefix='Importing BRS selected biddings:', 
         suffix='Complete')
     
     for i, file in enumerate(files_list):
-        name = carpeta + file
-        df_temporal = pd.read_excel(
-            io=name,
-            sheet_name=5,
-            skiprows=2,
-            header=0)
-        df_temporal.drop(columns=columns_to_drop, inplace=True, errors='ignore')
-        df_temporal = df_temporal.groupby(by=['Sentido', 'Unidad de Programación']).sum().copy()
-        df_temporal_subir = df_temporal.loc['Subir']
-        df_temporal_bajar = df_temporal.loc['Bajar']
-        df_temporal_subir = df_temporal_subir.transpose().copy()
-        df_temporal_bajar = df_temporal_bajar.transpose().copy()
-
-        string_fecha = file[7:15]
-        string_fecha_completa = (
-            string_fecha[:4] + '-'
-            + string_fecha[4:6] + '-'
-            + string_fecha[6:])
-        df_temporal_subir.set_index(
-            pd.date_range(
-                start=string_fecha_completa,
-                end=string_fecha_completa+' 23:00',
-                freq='H',tz='Europe/Madrid'),
-            inplace=True)
-        df_temporal_bajar.set_index(
-            pd.date_range(
-                start=string_fecha_completa,
-                end=string_fecha_completa+' 23:00',
-                freq='H',tz='Europe/Madrid'),
-            inplace=True)
-        
+        df_temporal = leer_hojas_i90dia(carpeta, file, hojas=[5])[5]
+        df_temporal_subir, df_temporal_bajar = procesar_brs_casada_dia(
+            df_temporal, obtener_fecha_archivo(file))
         lista_casada_subir.append(df_temporal_subir)
         lista_casada_bajar.append(df_temporal_bajar)
         print_progress(i+1, l, prefix='Importing BRS selected biddings:', 
@@ -268,31 +433,10 @@ def obtener_p48(participantes_secundaria, carpeta, files_list):
         suffix='Complete')
 
     for i, file in enumerate(files_list):
-        name = carpeta + file
-        df_temporal = pd.read_excel(
-            io=name,
-            sheet_name=2,
-            skiprows=3,
-            header=0)
-        df_temporal = (df_temporal.loc[
-            df_temporal['Unidad de Programación']
-            .isin(participantes_secundaria)])
-        df_temporal = (
-            df_temporal.set_index(['Unidad de Programación'])
-            .drop(columns=['Tipo Oferta', 'Hora', 'Total'])
-            .fillna(0).copy().transpose())
-        string_fecha = file[7:15]
-        string_fecha_completa = (
-            string_fecha[:4] + '-'
-            + string_fecha[4:6] + '-'
-            + string_fecha[6:])
-        df_temporal.set_index(
-            pd.date_range(
-                start=string_fecha_completa,
-                end=string_fecha_completa+' 23:00',
-                freq='H',tz='Europe/Madrid'), 
-            inplace=True)
-        lista_p48.append(df_temporal)
+        df_temporal = leer_hojas_i90dia(carpeta, file, hojas=[2])[2]
+        lista_p48.append(procesar_programa_dia(
+            df_temporal, obtener_fecha_archivo(file),
+            participantes_secundaria))
         print_progress(i+1, l, prefix='Importing P48 power:', 
             suffix='Complete')
 
@@ -302,10 +446,329 @@ def obtener_p48(participantes_secundaria, carpeta, files_list):
     return df_p48
 
 
-def obtener_pot_max(start_date, end_date, participantes_secundaria):
-    uf_file = ('/home/alejandro/Documentos/Universidad/MII_2/TFM/'
-        'TrabajoConDatos/info_descargada/informacion_centrales/'
-        'unidades_fisicas.csv')
+def procesar_archivo_i90dia(carpeta, file, carpeta_cache=None):
+    """Read an I90DIA file once and process all its relevant sheets.
+    Return a tuple with: (set of BRS bidders of the day, PVP power,
+    P48 power, BRS biddings to increase power, BRS biddings to
+    decrease power, detailed BRS biddings, BRS selected biddings to
+    increase power, BRS selected biddings to decrease power).
+
+    PVP and P48 are not filtered, as the BRS bidders of the whole
+    period are not known while the day is processed.
+
+    Keyword arguments:
+    carpeta -- path to the documents with raw data (I90DIA)
+    file -- name of the I90DIA file to read
+    carpeta_cache -- path to the folder with the cached sheets (no
+        cache is used if None)
+    """
+    fecha = obtener_fecha_archivo(file)
+    dic_hojas = leer_hojas_i90dia(
+        carpeta, file, carpeta_cache=carpeta_cache)
+    (df_ofertada_subir,
+     df_ofertada_bajar,
+     df_ofertada_detalle) = procesar_brs_ofertada_dia(dic_hojas[13], fecha)
+    df_casada_subir, df_casada_bajar = procesar_brs_casada_dia(
+        dic_hojas[5], fecha)
+    return (procesar_ofertantes_dia(dic_hojas[13]),
+            procesar_programa_dia(dic_hojas[1], fecha),
+            procesar_programa_dia(dic_hojas[2], fecha),
+            df_ofertada_subir,
+            df_ofertada_bajar,
+            df_ofertada_detalle,
+            df_casada_subir,
+            df_casada_bajar)
+
+
+def obtener_datos_i90dia(carpeta, files_list, procesos=1,
+                         participantes_secundaria=None,
+                         carpeta_cache=None):
+    """Read every I90DIA file only once and obtain from that single
+    read all the information that obtener_ofertantes_secundaria,
+    obtener_pvp, obtener_brs_ofertada, obtener_brs_casada and
+    obtener_p48 return. Return a tuple with: (list of BRS bidders,
+    PVP power, BRS biddings to increase power, BRS biddings to
+    decrease power, detailed BRS biddings, BRS selected biddings to
+    increase power, BRS selected biddings to decrease power, P48
+    power).
+
+    Keyword arguments:
+    carpeta -- path to the documents with raw data (I90DIA)
+    files_list -- list of raw data documents relevant for the study
+    procesos -- number of worker processes used to read the files.
+        With 1 the files are read in the current process.
+    participantes_secundaria -- list of BRS bidders already known
+        from previously read files. The bidders found in files_list
+        are added to them.
+    carpeta_cache -- path to the folder with the cached sheets (no
+        cache is used if None)
+    """
+    resultados_dias = [None] * len(files_list)
+    # Progress bar
+    l=len(files_list)
+    print_progress(0, l, prefix='Importing I90DIA files:',
+        suffix='Complete')
+
+    if procesos > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            futuros = {
+                executor.submit(
+                    procesar_archivo_i90dia, carpeta, file, carpeta_cache,
+                ): i
+                for i, file in enumerate(files_list)
+            }
+            for i, futuro in enumerate(as_completed(futuros)):
+                resultados_dias[futuros[futuro]] = futuro.result()
+                print_progress(i+1, l, prefix='Importing I90DIA files:',
+                    suffix='Complete')
+    else:
+        for i, file in enumerate(files_list):
+            resultados_dias[i] = procesar_archivo_i90dia(
+                carpeta, file, carpeta_cache)
+            print_progress(i+1, l, prefix='Importing I90DIA files:',
+                suffix='Complete')
+
+    # Every result keeps the position of its file in files_list, so
+    # the days are merged in date order whatever order they finished.
+    ofertantes_totales = set(participantes_secundaria or [])
+    for resultado_dia in resultados_dias:
+        ofertantes_totales = ofertantes_totales.union(resultado_dia[0])
+    participantes_secundaria = sorted(ofertantes_totales)
+
+    (lista_pvp,
+     lista_p48,
+     lista_ofertada_subir,
+     lista_ofertada_bajar,
+     lista_ofertada_detalle,
+     lista_casada_subir,
+     lista_casada_bajar) = [list(lista) for lista in zip(*resultados_dias)][1:]
+    lista_pvp = [
+        df.loc[:, df.columns.isin(participantes_secundaria)]
+        for df in lista_pvp]
+    lista_p48 = [
+        df.loc[:, df.columns.isin(participantes_secundaria)]
+        for df in lista_p48]
+
+    resultados = [participantes_secundaria]
+    for lista in [lista_pvp, lista_ofertada_subir, lista_ofertada_bajar,
+                  lista_casada_subir, lista_casada_bajar, lista_p48]:
+        df = pd.concat(lista, axis=0, join='outer', sort=False)
+        df.fillna(0, inplace=True)
+        resultados.append(df)
+    # The detailed biddings keep their missing values.
+    resultados.insert(
+        4, crear_tabla_ofertas_detalladas(lista_ofertada_detalle))
+
+    return tuple(resultados)
+
+
+def guardar_ofertas_detalladas(df_ofertas, carpeta_ofertas):
+    """Store the detailed BRS biddings in a Parquet dataset with a
+    folder per direction and year (Sentido=.../Año=...). The rows of
+    every file are sorted by Unidad de Programación and hour, so the
+    statistics of each row group let queries skip the rest of the
+    file. The hours already stored that are present in df_ofertas are
+    replaced, the rest are kept.
+
+    Keyword arguments:
+    df_ofertas -- detailed biddings as returned by
+        crear_tabla_ofertas_detalladas
+    carpeta_ofertas -- path to the folder of the dataset
+    """
+    df_ofertas = df_ofertas.assign(Año=df_ofertas['Hora'].dt.year)
+    for (sentido, año), df_particion in df_ofertas.groupby(
+            ['Sentido', 'Año'], observed=True):
+        carpeta_particion = '{}Sentido={}/Año={}/'.format(
+            carpeta_ofertas, sentido, año)
+        ruta = carpeta_particion + 'ofertas.parquet'
+        df_particion = df_particion.drop(columns=['Sentido', 'Año'])
+        # The Unidades de Programación are stored as strings, so the
+        # ones already stored are kept whatever the new categories are.
+        df_particion['Unidad de Programación'] = (
+            df_particion['Unidad de Programación'].astype(str))
+        if os.path.isfile(ruta):
+            df_previo = pd.read_parquet(ruta)
+            df_previo = df_previo.loc[
+                ~df_previo['Hora'].isin(df_particion['Hora'].unique())]
+            df_particion = pd.concat(
+                [df_previo.astype(df_particion.dtypes), df_particion],
+                ignore_index=True)
+        df_particion = df_particion.sort_values(
+            ['Unidad de Programación', 'Hora'])
+        os.makedirs(carpeta_particion, exist_ok=True)
+        # Write to a temporary file first so that readers never find a
+        # half written partition.
+        ruta_temporal = '{}.{}.tmp'.format(ruta, os.getpid())
+        df_particion.to_parquet(
+            ruta_temporal, index=False, row_group_size=100000)
+        os.replace(ruta_temporal, ruta)
+
+
+def consultar_ofertas_detalladas(carpeta_ofertas, centrales=None,
+                                 sentido=None, start_date=None,
+                                 end_date=None):
+    """Read from the dataset written by guardar_ofertas_detalladas only
+    the detailed BRS biddings that match the query. Only the matching
+    partitions and row groups are read, memory mapped.
+
+    Keyword arguments:
+    carpeta_ofertas -- path to the folder of the dataset
+    centrales -- list of Unidades de Programación (all if None)
+    sentido -- 'Subir' or 'Bajar' (both if None)
+    start_date -- first day as a 'YYYY-MM-DD' string (included)
+    end_date -- last day as a 'YYYY-MM-DD' string (included)
+    """
+    filtros = []
+    if centrales is not None:
+        filtros.append(('Unidad de Programación', 'in', list(centrales)))
+    if sentido is not None:
+        filtros.append(('Sentido', '=', sentido))
+    if start_date is not None:
+        inicio = obtener_horas_dia(start_date)[0]
+        filtros.append(('Año', '>=', inicio.year))
+        filtros.append(('Hora', '>=', inicio))
+    if end_date is not None:
+        final = obtener_horas_dia(end_date)[-1]
+        filtros.append(('Año', '<=', final.year))
+        filtros.append(('Hora', '<=', final))
+    df_ofertas = pd.read_parquet(
+        carpeta_ofertas, filters=filtros or None, memory_map=True)
+    df_ofertas = df_ofertas.drop(columns=['Año'])
+    for columna, tipo in COLUMNAS_OFERTAS_DETALLADAS.items():
+        df_ofertas[columna] = df_ofertas[columna].astype(tipo)
+    return df_ofertas[
+        list(COLUMNAS_OFERTAS_DETALLADAS) + ['Hora', 'MW', '€/MWh']]
+
+
+def crear_manifiesto(carpeta, files_list):
+    """Return a dataframe indexed by file name with the size and the
+    last modification time of every file passed. It is used to know
+    which I90DIA files have already been read.
+
+    Keyword arguments:
+    carpeta -- path to the documents with raw data (I90DIA)
+    files_list -- list of raw data documents relevant for the study
+    """
+    registros = []
+    for file in files_list:
+        estado = os.stat(carpeta + file)
+        registros.append([file, estado.st_size, estado.st_mtime_ns])
+    df_manifiesto = pd.DataFrame(
+        registros,
+        columns=['Archivo', 'Tamaño', 'Fecha de modificación'],
+    )
+    return df_manifiesto.set_index('Archivo')
+
+
+def leer_manifiesto(carpeta_de_informacion):
+    """Read the manifest of the I90DIA files already read. Return an
+    empty manifest if it does not exist yet.
+
+    Keyword arguments:
+    carpeta_de_informacion -- Path to the folder with the processed
+        information.
+    """
+    ruta = carpeta_de_informacion + 'manifiesto_i90dia.csv'
+    if not os.path.isfile(ruta):
+        return crear_manifiesto('', [])
+    return pd.read_csv(ruta, sep=';', index_col=0)
+
+
+def guardar_manifiesto(df_manifiesto, carpeta_de_informacion):
+    """Store the manifest of the I90DIA files already read.
+
+    Keyword arguments:
+    df_manifiesto -- manifest as returned by crear_manifiesto
+    carpeta_de_informacion -- Path to the folder with the processed
+        information.
+    """
+    df_manifiesto.to_csv(
+        carpeta_de_informacion + 'manifiesto_i90dia.csv',
+        sep=';',
+    )
+
+
+def obtener_archivos_pendientes(carpeta, files_list, df_manifiesto):
+    """Return the files of the list that are not in the manifest or
+    whose size or modification time has changed since they were read.
+
+    Keyword arguments:
+    carpeta -- path to the documents with raw data (I90DIA)
+    files_list -- list of raw data documents relevant for the study
+    df_manifiesto -- manifest of the files already read
+    """
+    df_actual = crear_manifiesto(carpeta, files_list)
+    df_previo = df_manifiesto.reindex(df_actual.index)
+    modificados = (
+        (df_actual['Tamaño'] != df_previo['Tamaño'])
+        | (df_actual['Fecha de modificación']
+           != df_previo['Fecha de modificación'])
+    )
+    return list(df_actual.index[modificados])
+
+
+def actualizar_datos_ofertantes(df_potencias, dataframes):
+    """Merge the data of the newly read days into the data already
+    stored in a table created by crear_tabla_ofertantes. Return a
+    dictionary like the one passed that can be used to create the
+    updated table.
+
+    The hours present in the new dataframes replace the stored ones.
+    New BRS bidders widen the table without reading the previous days
+    again. As when all the files are read at once, the bidders with
+    data of a type get 0 in the hours without it and the bidders
+    without any data of that type keep NaN.
+
+    Keyword arguments:
+    df_potencias -- table previously created by crear_tabla_ofertantes
+    dataframes -- dictionary with the name of the data as key and the
+        dataframe with the newly read data as value
+    """
+    tipos_almacenados = df_potencias.columns.get_level_values(1).unique()
+    dataframes_actualizados = dict()
+    for name, df in dataframes.items():
+        if name in tipos_almacenados:
+            df_anterior = df_potencias.xs(name, axis=1, level=1)
+        else:
+            df_anterior = pd.DataFrame(index=df_potencias.index)
+        df_anterior = df_anterior.loc[~df_anterior.index.isin(df.index)]
+        columnas = df_anterior.columns.union(df.columns)
+        df_actualizado = pd.concat(
+            [df_anterior.reindex(columns=columnas),
+             df.reindex(columns=columnas)],
+            axis=0, sort=False,
+        ).sort_index()
+        con_datos = df_actualizado.columns[df_actualizado.notna().any()]
+        df_actualizado[con_datos] = df_actualizado[con_datos].fillna(0)
+        dataframes_actualizados[name] = df_actualizado
+    return dataframes_actualizados
+
+
+def obtener_pot_max(start_date, end_date, participantes_secundaria,
+                    uf_file=None, columna_inicio=None, columna_fin=None):
+    """Obtain the maximum power and the enabled power (leaving out the
+    'Hidráulica no UGH' physical units) of every Unidad de
+    Programación for every hour between start_date and end_date.
+    Return a tuple of 2 dataframes: (maximum power, enabled power).
+
+    The physical units of every Unidad de Programación are added up in
+    a single grouped pass. If the columns with the dates when every
+    physical unit starts and stops being available are passed, the
+    power of the unit only counts from its start date (included) to
+    its end date (excluded). Empty dates leave the period open.
+
+    Keyword arguments:
+    start_date -- first day as a 'YYYY-MM-DD' string
+    end_date -- last day as a 'YYYY-MM-DD' string
+    participantes_secundaria -- list of power units to get data from
+    uf_file -- path to the esios physical units csv
+    columna_inicio -- column of uf_file with the start dates
+    columna_fin -- column of uf_file with the end dates
+    """
+    if uf_file is None:
+        uf_file = ('/home/alejandro/Documentos/Universidad/MII_2/TFM/'
+            'TrabajoConDatos/info_descargada/informacion_centrales/'
+            'unidades_fisicas.csv')
     df_uf = pd.read_csv(
         uf_file,
         header=0,
@@ -316,56 +779,66 @@ def obtener_pot_max(start_date, end_date, participantes_secundaria):
         .isin(participantes_secundaria)
         ]
     )
-    df_uf['Potencia máxima MW'] = (
+    potencias = (
         df_uf['Potencia máxima MW'].apply(
             lambda x: float(str(x).replace(',','.'))
         )
-    )
-    df_pot_max = pd.DataFrame(
-        index=pd.date_range(
-            start=start_date,
-            end=end_date+' 23:00',
-            freq='H',tz='Europe/Madrid',
-        ),
-        columns=participantes_secundaria,
-    )
-    df_pot_hab = df_pot_max.copy()
-    for up in participantes_secundaria:
-        try:
-            df_pot_max.loc[:,up] = (
-                df_uf.groupby(['Vinculación con UP']).sum()
-                .loc[up,'Potencia máxima MW']
-            )
-        except KeyError:
-            df_pot_max.loc[:,up] = np.nan
-            pass
-            print(
-                ("No existen datos para la unidad de producción {}"
-                .format(up))
-            )
-    df_uf = (df_uf.loc[
+    ).fillna(0).to_numpy()
+    habilitadas = (
         ~df_uf['Tipo de producción'].isin(['Hidráulica no UGH'])
-        ]
+    ).to_numpy()
+
+    indice = obtener_calendario(start_date, end_date)
+    centrales = pd.Index(participantes_secundaria)
+    columnas = centrales.get_indexer(df_uf['Vinculación con UP'])
+
+    # Position of the first and the following to the last hour of
+    # every physical unit in the calendar.
+    inicios = np.zeros(len(df_uf), dtype=int)
+    finales = np.full(len(df_uf), len(indice))
+    for columna, posiciones in [(columna_inicio, inicios),
+                                (columna_fin, finales)]:
+        if columna is None:
+            continue
+        fechas = pd.to_datetime(df_uf[columna], dayfirst=True)
+        fechas = pd.DatetimeIndex(fechas).tz_localize(
+            ZONA_HORARIA, ambiguous='NaT', nonexistent='shift_forward')
+        definidas = ~fechas.isna()
+        posiciones[definidas] = indice.searchsorted(fechas[definidas])
+
+    # Every physical unit adds its power at its first hour and removes
+    # it after its last one, so the cumulative sum over the hours gives
+    # the power available at every hour.
+    variaciones = np.zeros((len(indice) + 1, len(centrales), 2))
+    valores = np.column_stack([potencias, potencias * habilitadas])
+    np.add.at(variaciones, (inicios, columnas), valores)
+    np.add.at(variaciones, (finales, columnas), -valores)
+    bloque = np.cumsum(variaciones[:-1], axis=0)
+
+    sin_datos = ~centrales.isin(df_uf['Vinculación con UP'])
+    solo_no_ugh = (
+        ~sin_datos
+        & ~centrales.isin(df_uf.loc[habilitadas, 'Vinculación con UP'])
     )
-    for up in participantes_secundaria:
-        try:
-            df_pot_hab.loc[:,up] = (
-                df_uf.groupby(['Vinculación con UP']).sum()
-                .loc[up,'Potencia máxima MW']
-            )
-        except KeyError:
-            if np.isnan(df_pot_max.loc[df_pot_max.index[0],up]):
-                df_pot_hab.loc[:,up] = np.nan
-            else:
-                df_pot_hab.loc[:,up] = 0
-                print(
-                ("La unidad de producción {} solamente "
-                 "tiene unidades físicas 'Hidráulica no UGH', "
-                 "por lo que su potencia habilitada " 
-                 "es 0.".format(up))
-            )
-            pass
-    
+    bloque[:, sin_datos, :] = np.nan
+    for up in centrales[sin_datos]:
+        print(
+            ("No existen datos para la unidad de producción {}"
+            .format(up))
+        )
+    for up in centrales[solo_no_ugh]:
+        print(
+            ("La unidad de producción {} solamente "
+             "tiene unidades físicas 'Hidráulica no UGH', "
+             "por lo que su potencia habilitada "
+             "es 0.".format(up))
+        )
+
+    df_pot_max = pd.DataFrame(
+        bloque[:, :, 0], index=indice, columns=participantes_secundaria)
+    df_pot_hab = pd.DataFrame(
+        bloque[:, :, 1], index=indice, columns=participantes_secundaria)
+
     return df_pot_max, df_pot_hab
 
 
@@ -373,36 +846,99 @@ def crear_tabla_ofertantes(dataframes):
     """Merge all dataframes passe in a multiindex column dataframe
     and return it.
 
+    The values are written straight into a preallocated array of
+    (hours, Unidades de Programación, data types), so no long format
+    intermediate table is created.
+
     Dataframes:
     first element of the pair -- dataframe
     second element of the pair -- name of the data
     """
-    lista_dataframes = []
-    for name, df in dataframes.items():
-        df_aux = pd.DataFrame(df.stack())
-        df_aux.loc[:,'tipo_de_dato'] = name
-        df_aux.set_index('tipo_de_dato',append=True,inplace=True)
-        lista_dataframes.append(df_aux)
-    df_final = pd.concat(lista_dataframes)
-    df_final = (
-        df_final.swaplevel().unstack(2).droplevel(0,axis=1).unstack()
-    )
-    df_final.columns.rename(
-        ['Unidad de Programación', 'Tipo de dato'],
-        inplace=True,
+    nombres = sorted(dataframes.keys())
+    indice = None
+    centrales = None
+    for df in dataframes.values():
+        if indice is None:
+            indice = df.index
+            centrales = df.columns
+        else:
+            indice = indice.union(df.index)
+            centrales = centrales.union(df.columns)
+    indice = indice.sort_values()
+    centrales = centrales.sort_values()
+
+    bloque = np.full((len(indice), len(centrales), len(nombres)), np.nan)
+    for k, name in enumerate(nombres):
+        df = dataframes[name]
+        filas = indice.get_indexer(df.index)
+        columnas = centrales.get_indexer(df.columns)
+        bloque[filas[:, None], columnas[None, :], k] = (
+            df.to_numpy(dtype=float))
+
+    df_final = pd.DataFrame(
+        bloque.reshape(len(indice), len(centrales) * len(nombres)),
+        index=indice,
+        columns=pd.MultiIndex.from_product(
+            [centrales, nombres],
+            names=['Unidad de Programación', 'Tipo de dato'],
+        ),
     )
     return df_final
 
 
-def obtener_datos_mercado(carpeta_de_datos_mercado):
+# Market indicators measured as energy per period (MWh), which are
+# added up over every hour instead of averaged. They are recognised by
+# the beginning of their name.
+PREFIJOS_INDICADORES_ENERGIA = ('Energía',)
+
+
+def obtener_extremos_mercado(carpeta_de_datos_mercado, files_list_mercado,
+                             tamano_bloque=100000):
+    """Return the first and last day ('YYYY-MM-DD' strings) with data
+    in the market csv files passed. Only the 'datetime' column of the
+    files is read.
+
+    Keyword arguments:
+    carpeta_de_datos_mercado -- Path to the folder with the files
+    files_list_mercado -- list of market csv files
+    tamano_bloque -- number of rows read at a time
+    """
+    inicio = None
+    final = None
+    for file in files_list_mercado:
+        for df_bloque in pd.read_csv(
+                carpeta_de_datos_mercado+file, sep=';',
+                usecols=['datetime'], chunksize=tamano_bloque):
+            fechas = pd.to_datetime(df_bloque['datetime'], utc=True)
+            if inicio is None or fechas.min() < inicio:
+                inicio = fechas.min()
+            if final is None or fechas.max() > final:
+                final = fechas.max()
+    return (inicio.tz_convert(ZONA_HORARIA).strftime('%Y-%m-%d'),
+            final.tz_convert(ZONA_HORARIA).strftime('%Y-%m-%d'))
+
+
+def obtener_datos_mercado(carpeta_de_datos_mercado, start_date=None,
+                          end_date=None, tamano_bloque=100000):
     """Import data from the electricity market. Scan all csv files
     in the folder passed. All must have the same structure provided
     by REE. Returns a dataframe with a datetime index and the
     data in the columns.
 
+    The files are read in blocks of rows that are written straight
+    into an hourly array, placing every value by its timestamp. Data
+    with a finer granularity than one hour (like quarter-hours) is
+    added up over each hour for the energy indicators (see
+    PREFIJOS_INDICADORES_ENERGIA) and averaged for the rest, like
+    prices and power requirements. Hours without data are 0.
+
     Keyword arguments:
     carpeta_de_datos_mercado -- Path to the folder with the
         desired files
+    start_date -- first day of the table as a 'YYYY-MM-DD' string
+    end_date -- last day of the table as a 'YYYY-MM-DD' string
+        If any of them is None the days are taken from the files.
+    tamano_bloque -- number of rows read at a time
     """
     files_list_mercado = (
         sorted(fnmatch.filter(
@@ -410,35 +946,49 @@ def obtener_datos_mercado(carpeta_de_datos_mercado):
             '*.csv')
         )
     )
-    lista_info_mercado = []
-    start_date = []
-    end_date = []
-
-    for file in files_list_mercado:
-        df_temporal = pd.read_csv(
-            carpeta_de_datos_mercado+file, 
-            sep=';'
-        )
-        start_date.append(pd.to_datetime(df_temporal.loc[df_temporal.index[0],'datetime'],))
-        end_date.append(pd.to_datetime(df_temporal.loc[df_temporal.index[-1],'datetime'],))
-        name = df_temporal.loc[0,'name']
-        df_temporal = df_temporal.loc[:,['datetime', 'value']]
-        df_temporal.set_index(['datetime'], inplace=True)
-        df_temporal.rename(
-            columns={'value': name},
-            inplace=True
-        )
-        lista_info_mercado.append(df_temporal)
-    
-    df_mercado_secundaria = pd.concat(lista_info_mercado,axis=1,sort=True)
-    df_mercado_secundaria.fillna(0, inplace=True,)
-    df_mercado_secundaria.index=pd.date_range(
-        start=sorted(start_date)[0].strftime('%Y-%m-%d %H:%M:%S'),
-        end=sorted(end_date)[-1].strftime('%Y-%m-%d %H:%M:%S'),
-        freq='H',tz='Europe/Madrid',
-    )
+    if start_date is None or end_date is None:
+        inicio, final = obtener_extremos_mercado(
+            carpeta_de_datos_mercado, files_list_mercado, tamano_bloque)
+        start_date = start_date or inicio
+        end_date = end_date or final
+    indice = obtener_calendario(start_date, end_date)
+    instantes = indice.asi8
+
+    sumas = np.zeros((len(indice), len(files_list_mercado)))
+    conteos = np.zeros((len(indice), len(files_list_mercado)))
+    nombres = []
+
+    for j, file in enumerate(files_list_mercado):
+        name = None
+        for df_bloque in pd.read_csv(
+                carpeta_de_datos_mercado+file, sep=';',
+                usecols=['datetime', 'value', 'name'],
+                chunksize=tamano_bloque):
+            if name is None:
+                name = df_bloque['name'].iloc[0]
+            df_bloque = df_bloque.loc[df_bloque['value'].notna()]
+            horas = pd.DatetimeIndex(
+                pd.to_datetime(df_bloque['datetime'], utc=True)
+            ).floor('H').asi8
+            posiciones = np.searchsorted(instantes, horas)
+            en_calendario = (
+                (posiciones < len(instantes))
+                & (instantes[np.minimum(posiciones, len(instantes)-1)]
+                   == horas)
+            )
+            np.add.at(
+                sumas[:, j], posiciones[en_calendario],
+                df_bloque['value'].to_numpy(dtype=float)[en_calendario])
+            np.add.at(conteos[:, j], posiciones[en_calendario], 1)
+        nombres.append(name)
+
+    medias = np.divide(
+        sumas, conteos, out=np.zeros_like(sumas), where=conteos > 0)
+    energias = np.array(
+        [str(nombre).startswith(PREFIJOS_INDICADORES_ENERGIA)
+         for nombre in nombres], dtype=bool)
+    valores = np.where(energias, sumas, medias)
+    df_mercado_secundaria = pd.DataFrame(
+        valores, index=indice, columns=nombres)
 
     return df_mercado_secundaria
-
-
-
@@ -1,6 +1,15 @@
+import os
+import json
+import hashlib
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
-from funciones_auxiliares import print_progress
+from funciones_auxiliares import (
+    print_progress, guardar_tabla_columnar, leer_tabla_columnar,
+    leer_horas_tabla_columnar, convertir_indice_horario)
 
 
 def leer_participantes_secundaria(carpeta_de_informacion):
@@ -22,22 +31,50 @@ def leer_participantes_secundaria(carpeta_de_informacion):
     return participantes_secundaria
 
 
-def leer_tabla_potencia(carpeta_de_informacion):
+def leer_tabla_potencia(carpeta_de_informacion, centrales=None,
+                        tipos_de_dato=None, inicio=None, fin=None):
+    """Read the hourly power table of the Unidades de Programación.
+    The Parquet copy of the table is used if it exists, reading only
+    the columns and hours requested. Otherwise the whole csv table is
+    read and then filtered.
+
+    Keyword arguments:
+    carpeta_de_informacion -- Path to the folder with the tables.
+    centrales -- list of Unidades de Programación to read (all of
+        them if None).
+    tipos_de_dato -- list of data types to read, like 'P48' or
+        'BRS_cas_sub' (all of them if None).
+    inicio -- first hour to read (from the first hour if None).
+    fin -- hour after the last one to read (until the last hour if
+        None).
+    """
     print('Reading hourly power dataframe...')
+    ruta_parquet = carpeta_de_informacion+'tabla_potencia_agregada.parquet'
+    if os.path.isfile(ruta_parquet):
+        return leer_tabla_columnar(
+            ruta_parquet, seleccion=[centrales, tipos_de_dato],
+            inicio=inicio, fin=fin,
+        )
+
     df_potencias = pd.read_csv(
         carpeta_de_informacion+'tabla_potencia_agregada.csv',
         sep=';',
         index_col=0,
         low_memory=False,
         header=[0,1],
-        parse_dates=True
     )
 
-    df_potencias.index = pd.date_range(
-        start=df_potencias.index[0].strftime('%Y-%m-%d %H:%M'),
-        end=df_potencias.index[-1].strftime('%Y-%m-%d %H:%M'),
-        freq='H',tz='Europe/Madrid',
-    )
+    df_potencias.index = convertir_indice_horario(df_potencias.index)
+    if centrales is not None:
+        df_potencias = df_potencias.loc[
+            :, df_potencias.columns.get_level_values(0).isin(centrales)]
+    if tipos_de_dato is not None:
+        df_potencias = df_potencias.loc[
+            :, df_potencias.columns.get_level_values(1).isin(tipos_de_dato)]
+    if inicio is not None:
+        df_potencias = df_potencias.loc[df_potencias.index >= inicio]
+    if fin is not None:
+        df_potencias = df_potencias.loc[df_potencias.index < fin]
     return df_potencias
 
 
@@ -49,13 +86,8 @@ def leer_tabla_mercado(carpeta_de_informacion):
         index_col=0,
         low_memory=False,
         header=[0],
-        parse_dates=True
-    )
-    df_mercado.index = pd.date_range(
-        start=df_mercado.index[0].strftime('%Y-%m-%d %H:%M'),
-        end=df_mercado.index[-1].strftime('%Y-%m-%d %H:%M'),
-        freq='H',tz='Europe/Madrid',
     )
+    df_mercado.index = convertir_indice_horario(df_mercado.index)
     return df_mercado
 
 
@@ -105,109 +137,327 @@ def obtener_empresa_centrales(participantes_secundaria,
     return centrales_en_empresa, empresa_de_central
 
 
+def leer_tabla_margenes_potencia(carpeta_de_informacion, centrales=None,
+                                 planificaciones=None, bandas=None,
+                                 margenes=None):
+    """Read the power margins table of the Unidades de Programación
+    stored by obtener_margenes_potencia, reading only the columns
+    requested.
+
+    Keyword arguments:
+    carpeta_de_informacion -- Path to the folder with the tables.
+    centrales -- list of Unidades de Programación to read.
+    planificaciones -- list with 'P48' and/or 'PVP'.
+    bandas -- list with 'Casada' and/or 'Ofertada'.
+    margenes -- list with 'Superior' and/or 'Inferior'.
+    Every level is read completely if None is passed.
+    """
+    return leer_tabla_derivada(
+        carpeta_de_informacion, 'tabla_margenes_potencia_up',
+        grupos=centrales,
+        seleccion=[planificaciones, bandas, margenes],
+    )
+
+
+# Values of the levels of the power margins tables and the data types
+# of the power table used for every BRS band and margin.
+PLANIFICACIONES = ['P48','PVP']
+BANDAS = ['Casada','Ofertada']
+MARGENES = ['Superior','Inferior']
+COLUMNAS_BANDAS = {
+    'Casada':{
+        'Superior':'BRS_cas_sub',
+        'Inferior':'BRS_cas_baj',
+    },
+    'Ofertada':{
+        'Superior':'BRS_of_sub',
+        'Inferior':'BRS_of_baj',
+    },
+}
+
+# Version of the way the power margins are computed. It is stored with
+# the margins tables, so it must be increased whenever the computation
+# changes to compute the stored tables again.
+VERSION_MARGENES = 1
+
+
+def calcular_margenes_potencia(df_potencias, centrales=None):
+    """Compute the power margins of the Unidades de Programación for
+    every type of power planning, offered or accepted biddings and up
+    or down margin. Return a dataframe with a column for every
+    combination of values.
+
+    All margins are computed at once over arrays of (planning, band,
+    hours, Unidades de Programación):
+    upper margin -- -BRS_sub if the planning is 0, otherwise the
+        minimum of pot_hab - BRS_sub and pot_max - planning - BRS_sub
+        (ignoring missing values).
+    lower margin -- planning - BRS_baj.
+
+    Keyword arguments:
+    df_potencias -- dataframe where all power information regarding
+    all Unidades de Programacion is stored.
+    centrales -- list of Unidades de Programación to compute (all of
+        them if None).
+    """
+    if centrales is None:
+        centrales = df_potencias.columns.get_level_values(0).unique()
+
+    def obtener_campo(tipo_de_dato):
+        return df_potencias.reindex(
+            columns=pd.MultiIndex.from_product([centrales, [tipo_de_dato]])
+        ).to_numpy(dtype=float)
+
+    planificacion = np.stack(
+        [obtener_campo(planificacion) for planificacion in PLANIFICACIONES]
+    )[:, None]
+    brs_sub = np.stack(
+        [obtener_campo(COLUMNAS_BANDAS[banda]['Superior'])
+         for banda in BANDAS]
+    )[None]
+    brs_baj = np.stack(
+        [obtener_campo(COLUMNAS_BANDAS[banda]['Inferior'])
+         for banda in BANDAS]
+    )[None]
+    pot_max = obtener_campo('pot_max')
+    pot_hab = obtener_campo('pot_hab')
+
+    sin_planificacion = planificacion == 0
+    margen_superior = (
+        sin_planificacion * (-brs_sub)
+        + ~sin_planificacion
+        * np.fmin(pot_hab - brs_sub, pot_max - planificacion - brs_sub)
+    )
+    margen_inferior = planificacion - brs_baj
+
+    # (planning, band, hours, central, margin) to
+    # (hours, central, planning, band, margin).
+    margenes = np.stack([margen_superior, margen_inferior], axis=-1)
+    margenes = margenes.transpose(2, 3, 0, 1, 4).reshape(
+        len(df_potencias.index), -1)
+    return pd.DataFrame(
+        margenes,
+        index=df_potencias.index,
+        columns=pd.MultiIndex.from_product(
+            [centrales, PLANIFICACIONES, BANDAS, MARGENES]),
+    )
+
+
+def obtener_hashes_grupos(df):
+    """Return a dictionary with every value of the first column level
+    of the dataframe as key and a hash of the index, the column names
+    and the values of its columns as value.
+    """
+    hashes = dict()
+    grupos = df.columns.get_level_values(0)
+    for grupo in grupos.unique():
+        df_grupo = df.loc[:, grupos == grupo]
+        hash_grupo = hashlib.sha1(
+            pd.util.hash_pandas_object(df_grupo, index=True)
+            .to_numpy().tobytes())
+        hash_grupo.update(repr(list(df_grupo.columns)).encode())
+        hashes[grupo] = hash_grupo.hexdigest()
+    return hashes
+
+
+def obtener_ruta_grupo(carpeta_tabla, grupo):
+    """Return the path of the Parquet file where a group of a derived
+    table is stored. The name of the group is quoted so that any
+    character can be used in a file name.
+    """
+    return carpeta_tabla + quote(str(grupo), safe='') + '.parquet'
+
+
+def leer_tabla_derivada(carpeta_de_informacion, nombre_tabla, grupos=None,
+                        seleccion=None):
+    """Read a table stored by obtener_tabla_derivada. Only the files
+    of the groups requested are read, and the first column level takes
+    the groups as they are passed (the names of the groups, which are
+    strings, if all of them are read). The index is named 'Hora' and
+    has no frequency.
+
+    Keyword arguments:
+    carpeta_de_informacion -- Path to the folder with the tables.
+    nombre_tabla -- name of the table.
+    grupos -- list of groups (first column level) to read, all the
+        stored groups if None.
+    seleccion -- list with, for every column level after the first
+        one, a list of the values to read or None to read all of them.
+    """
+    carpeta_tabla = carpeta_de_informacion+nombre_tabla+'/'
+    if grupos is None:
+        with open(carpeta_tabla+'hashes.json') as archivo:
+            grupos = list(json.load(archivo)['hashes'])
+    if seleccion is not None:
+        seleccion = [None] + list(seleccion)
+    lista_grupos = []
+    for grupo in grupos:
+        df_grupo = leer_tabla_columnar(
+            obtener_ruta_grupo(carpeta_tabla, grupo), seleccion=seleccion)
+        df_grupo.columns = pd.MultiIndex.from_tuples(
+            [(grupo,) + columna[1:] for columna in df_grupo.columns],
+            names=df_grupo.columns.names)
+        lista_grupos.append(df_grupo)
+    df_tabla = pd.concat(lista_grupos, axis=1)
+    df_tabla.index = pd.DatetimeIndex(df_tabla.index, freq=None, name='Hora')
+    return df_tabla
+
+
+def obtener_tabla_derivada(carpeta_de_informacion, nombre_tabla, hashes,
+                           calcular):
+    """Return a power margins table stored in the information folder
+    if it was computed from the same data, computing again only the
+    groups (first column level) whose data has changed.
+
+    Every group is stored in its own Parquet file in the folder
+    nombre_tabla, next to a json file with the hash of the data every
+    group was computed from and the parameters of the computation.
+    The stored groups whose hash matches the current one are reused.
+    Only the files of the groups computed again are written, and the
+    files of the groups that no longer exist are removed.
+
+    Keyword arguments:
+    carpeta_de_informacion -- Path to the folder with the tables.
+    nombre_tabla -- name of the table.
+    hashes -- dictionary with the groups of the table as keys and the
+        hash of the data they are computed from as values. The groups
+        are stored by their name as a string, but the table and
+        calcular get them as they are passed, even if they are not
+        strings (like a missing company).
+    calcular -- function that takes a list of groups and returns the
+        table with the margins of only those groups.
+    """
+    carpeta_tabla = carpeta_de_informacion+nombre_tabla+'/'
+    ruta_hashes = carpeta_tabla+'hashes.json'
+    parametros = json.dumps(
+        [VERSION_MARGENES, PLANIFICACIONES, BANDAS, MARGENES,
+         COLUMNAS_BANDAS])
+    grupos = list(hashes.keys())
+
+    hashes_previos = dict()
+    if os.path.isfile(ruta_hashes):
+        with open(ruta_hashes) as archivo:
+            contenido = json.load(archivo)
+        if contenido['parametros'] == parametros:
+            hashes_previos = contenido['hashes']
+
+    pendientes = [
+        grupo for grupo in grupos
+        if hashes_previos.get(str(grupo)) != hashes[grupo]
+        or not os.path.isfile(obtener_ruta_grupo(carpeta_tabla, grupo))]
+    sobrantes = set(hashes_previos) - set(map(str, grupos))
+    if not pendientes and not sobrantes:
+        print(
+            'Cache hit: "{}" has been imported from the information '
+            'folder.'.format(nombre_tabla))
+        return leer_tabla_derivada(
+            carpeta_de_informacion, nombre_tabla, grupos)
+    print(
+        'Cache miss: {} of {} groups of "{}" have to be computed.'
+        .format(len(pendientes), len(grupos), nombre_tabla))
+
+    os.makedirs(carpeta_tabla, exist_ok=True)
+    df_nuevos = calcular(pendientes)
+    niveles = df_nuevos.columns.get_level_values(0)
+    for grupo in pendientes:
+        guardar_tabla_columnar(
+            df_nuevos.loc[:, niveles.isin([grupo])],
+            obtener_ruta_grupo(carpeta_tabla, grupo))
+    with open(ruta_hashes, 'w') as archivo:
+        json.dump({
+            'parametros': parametros,
+            'hashes': {str(grupo): hashes[grupo] for grupo in grupos},
+        }, archivo)
+    for grupo in sobrantes:
+        ruta_grupo = obtener_ruta_grupo(carpeta_tabla, grupo)
+        if os.path.isfile(ruta_grupo):
+            os.remove(ruta_grupo)
+    print(
+        '{} groups of "{}" have been stored in the information folder.'
+        .format(len(pendientes), nombre_tabla))
+
+    columnas = pd.MultiIndex.from_product(
+        [grupos, PLANIFICACIONES, BANDAS, MARGENES],
+        names=df_nuevos.columns.names)
+    vigentes = [grupo for grupo in grupos if grupo not in pendientes]
+    if vigentes:
+        df_vigentes = leer_tabla_derivada(
+            carpeta_de_informacion, nombre_tabla, vigentes)
+        df_tabla = pd.concat(
+            [df_vigentes, df_nuevos.reindex(df_vigentes.index)], axis=1,
+        ).reindex(columns=columnas)
+    else:
+        df_tabla = df_nuevos.reindex(columns=columnas)
+    # Same index as the table read back from the information folder.
+    df_tabla.index = pd.DatetimeIndex(df_tabla.index, freq=None, name='Hora')
+    return df_tabla
+
+
 def obtener_margenes_potencia(df_potencias, carpeta_de_informacion):
     """Create the power margins for every Unidad de Programación
     , type of power planning, offered or accepted biddings and
     up or down type. Return a dataframe with the power margins
     for all combinations of values.
 
+    The table is stored in the information folder and reused while
+    the power data of every Unidad de Programación does not change.
+    Only the Unidades de Programación whose data changed are computed
+    again.
+
     Keyword arguments:
     df_potencias -- dataframe where all power information regarding
     all Unidades de Programacion is stored.
     """
     print('Obtaining power margins dataframe...')
-    try:
-        df_margenes_potencia = pd.read_csv(
-            carpeta_de_informacion+'tabla_margenes_potencia_up.csv',
-            sep=';',
-            header=[0,1,2,3],
-            index_col=0,
-            parse_dates=True,
-            low_memory=False,
-        )
-        df_margenes_potencia.index = pd.date_range(
-            start=df_margenes_potencia.index[0].strftime('%Y-%m-%d %H:%M'),
-            end=df_margenes_potencia.index[-1].strftime('%Y-%m-%d %H:%M'),
-            freq='H',tz='Europe/Madrid',
-        )
-        print(
-            'The power margins dataframe has been imported from memory. '
-            'If you wish to compute it again please first erase the '
-            'file "tabla_margenes_potencia_up.csv" from your '
-            'information folder.'
-        )
-    except:
-        centrales = df_potencias.columns.get_level_values(0).unique()
-        planificaciones = ['P48','PVP']
-        bandas = ['Casada','Ofertada']
-        margenes = ['Superior','Inferior']
+    return obtener_tabla_derivada(
+        carpeta_de_informacion,
+        'tabla_margenes_potencia_up',
+        obtener_hashes_grupos(df_potencias),
+        lambda centrales: calcular_margenes_potencia(
+            df_potencias, pd.Index(centrales)),
+    )
 
-        df_margenes_potencia = pd.DataFrame(
-            columns=pd.MultiIndex.from_product(
-                [centrales,planificaciones,bandas,margenes]
-            ),
-            index=df_potencias.index,
-        )
-        dic_col = {
-            'Casada':{
-                'Superior':'BRS_cas_sub',
-                'Inferior':'BRS_cas_baj',
-            },
-            'Ofertada':{
-                'Superior':'BRS_of_sub',
-                'Inferior':'BRS_of_baj',
-            },
-        }
 
-        # Progress bar
-        l=len(centrales)
-        print_progress(
-            0, l, prefix='Creating power margins table:', 
-            suffix='Complete',
-        )
+def agregar_margenes_potencia(df_margenes_potencia, grupos):
+    """Add up the power margins of the Unidades de Programación of
+    every group passed. Return a dataframe like df_margenes_potencia
+    with the groups instead of the Unidades de Programación in the
+    first column level. Missing margins count as 0.
 
-        for i,central in enumerate(centrales):
-            for planificacion in planificaciones:
-                for banda in bandas:
-                    # Calcular el margen de potencia superior.
-                    df_aux = pd.DataFrame(
-                        index=df_potencias.index,
-                        columns=['pot_hab-BRS_sub','pot_max-planificacion-BRS_sub'],
-                    )
-                    df_aux.loc[:,'pot_hab-BRS_sub'] = (
-                        df_potencias.loc[:,(central,'pot_hab')] 
-                        - df_potencias.loc[:,(central,dic_col[banda]['Superior'])]
-                    )
-                    df_aux.loc[:,'pot_max-planificacion-BRS_sub'] = (
-                        df_potencias.loc[:,(central,'pot_max')]
-                        - df_potencias.loc[:,(central,planificacion)]
-                        - df_potencias.loc[:,(central,dic_col[banda]['Superior'])]
-                    )
-                    df_aux = df_aux.min(axis=1)
+    All groups are computed in a single product of the margins by a
+    matrix that marks the Unidades de Programación of every group, so
+    any grouping (companies, technologies, hypothetical mergers...)
+    can be computed at once. A Unidad de Programación may belong to
+    several groups.
 
-                    df_margenes_potencia.loc[:,(central,planificacion,banda,'Superior')] = (
-                        (df_potencias.loc[:,(central,planificacion)]==0)
-                        * (-df_potencias.loc[:,(central,dic_col[banda]['Superior'])])
-                        + (df_potencias.loc[:,(central,planificacion)]!=0)
-                        * df_aux
-                    )
+    Keyword arguments:
+    df_margenes_potencia -- power margins of every Unidad de
+        Programación as computed by calcular_margenes_potencia.
+    grupos -- Dictionary with the groups as keys and a list of their
+        Unidades de Programacion as values.
+    """
+    centrales = df_margenes_potencia.columns.get_level_values(0).unique()
+    nombres_grupos = list(grupos.keys())
+    pertenencia = np.zeros((len(centrales), len(nombres_grupos)))
+    for j, grupo in enumerate(nombres_grupos):
+        filas = centrales.get_indexer(grupos[grupo])
+        pertenencia[filas[filas >= 0], j] = 1
 
-                    # Calcular el margen de potencia inferior.
-                    df_margenes_potencia.loc[:,(central,planificacion,banda,'Inferior')] = (
-                        df_potencias.loc[:,(central,planificacion)]
-                        - df_potencias.loc[:,(central,dic_col[banda]['Inferior'])]
-                    )
-            print_progress(i+1, l, prefix='Creating power margins table:', 
-                        suffix='Complete')
-        df_margenes_potencia.to_csv(
-            carpeta_de_informacion+'tabla_margenes_potencia_up.csv',
-            sep=';',
-        )
-        print(
-            'The power margins dataframe has been stored in the '
-            'information folder. Next time it will be imported.'
-        )
-    return df_margenes_potencia
+    n_campos = len(PLANIFICACIONES) * len(BANDAS) * len(MARGENES)
+    margenes = np.nan_to_num(
+        df_margenes_potencia.reindex(
+            columns=pd.MultiIndex.from_product(
+                [centrales, PLANIFICACIONES, BANDAS, MARGENES])
+        ).to_numpy(dtype=float)
+    ).reshape(len(df_margenes_potencia.index), len(centrales), n_campos)
+    margenes_grupos = np.einsum('hcf,cg->hgf', margenes, pertenencia)
+
+    return pd.DataFrame(
+        margenes_grupos.reshape(len(df_margenes_potencia.index), -1),
+        index=df_margenes_potencia.index,
+        columns=pd.MultiIndex.from_product(
+            [nombres_grupos, PLANIFICACIONES, BANDAS, MARGENES]),
+    )
 
 
 def obtener_margenes_potencia_empresas(
@@ -218,141 +468,749 @@ def obtener_margenes_potencia_empresas(
     """Cumulate power margins per Unidad de Programacion to obtain the
     result for every Zona de Regulacion (company).
 
+    The table is stored in the information folder and reused while
+    the Unidades de Programación of every company and their power
+    margins do not change. Only the companies affected by a change
+    are computed again.
+
     Keyword arguments:
     df_margenes_potencia -- power margins of every Unidad de
         Programación as computed in the previous function.
     centrales_en_empresa -- Dictionary with companies as keys and a
         list of their Unidades de Programacion as values.
     """
-    try:
-        df_margenes_potencia_empresas = pd.read_csv(
-            carpeta_de_informacion+'tabla_margenes_potencia_empresas.csv',
-            sep=';',
-            header=[0,1,2,3],
-            index_col=0,
-            parse_dates=True,
-            low_memory=False,
-        )
-        df_margenes_potencia_empresas.index = pd.date_range(
-            start=(df_margenes_potencia_empresas.index[0]
-                   .strftime('%Y-%m-%d %H:%M')),
-            end=(df_margenes_potencia_empresas.index[-1]
-                 .strftime('%Y-%m-%d %H:%M')),
-            freq='H',tz='Europe/Madrid',
-        )
-        print(
-            'The companies power margins dataframe has been imported '
-            'from memory. '
-            'If you wish to compute it again please first erase the '
-            'file "tabla_margenes_potencia_empresas.csv" from your '
-            'information folder.'
-        )
-    except:
-        empresas = list(centrales_en_empresa.keys())
-        planificaciones = ['P48','PVP']
-        bandas = ['Casada','Ofertada']
-        margenes = ['Superior','Inferior']
-        df_margenes_potencia_empresas = pd.DataFrame(
-            columns=pd.MultiIndex.from_product(
-                [empresas,planificaciones,bandas,margenes]
-            ),
-            index=df_margenes_potencia.index,
-        )
+    hashes_centrales = obtener_hashes_grupos(df_margenes_potencia)
+    hashes_empresas = dict()
+    for empresa, centrales in centrales_en_empresa.items():
+        hash_empresa = hashlib.sha1()
+        for central in sorted(centrales):
+            hash_empresa.update(
+                (central + hashes_centrales.get(central, '')).encode())
+        hashes_empresas[empresa] = hash_empresa.hexdigest()
 
-        # Progress bar
-        l=len(empresas)
-        print_progress(
-            0, l, prefix='Creating company power margins table:', 
-            suffix='Complete',
-        )
+    return obtener_tabla_derivada(
+        carpeta_de_informacion,
+        'tabla_margenes_potencia_empresas',
+        hashes_empresas,
+        lambda empresas: agregar_margenes_potencia(
+            df_margenes_potencia,
+            {empresa: centrales_en_empresa[empresa] for empresa in empresas}),
+    )
 
-        for i,empresa in enumerate(empresas):
-            for planificacion in planificaciones:
-                for banda in bandas:
-                    for margen in margenes:
-                        df_margenes_potencia_empresas.loc[
-                            :,(empresa,planificacion,banda,margen)
-                        ] = (
-                            df_margenes_potencia.loc[
-                                :,
-                                (centrales_en_empresa[empresa],
-                                planificacion,banda,margen)
-                            ].sum(axis=1)
-                        )
-            print_progress(
-                i+1, l, prefix='Creating company power margins table:',
-                suffix='Complete',
-            )
-        df_margenes_potencia_empresas.to_csv(
-            carpeta_de_informacion+'tabla_margenes_potencia_empresas.csv',
-            sep=';',
-        )
-        print(
-            'The companies power margins dataframe has been stored in '
-            'the information folder. Next time it will be imported.'
-        )
-    
-    return df_margenes_potencia_empresas
 
+def crear_tabla_dispersa(df_marg_pot, calcular, valor_vacio):
+    """Apply calcular to the values of every column of the margins
+    table and return a dataframe of pandas sparse columns, which only
+    store the values different from valor_vacio. Only one column is
+    made dense at a time.
+    """
+    df_disperso = pd.DataFrame(
+        {i: pd.arrays.SparseArray(
+            calcular(df_marg_pot.iloc[:, i].to_numpy(dtype=float)),
+            fill_value=valor_vacio)
+         for i in range(len(df_marg_pot.columns))},
+        index=df_marg_pot.index,
+    )
+    df_disperso.columns = df_marg_pot.columns
+    return df_disperso
 
-def obtener_mw_imposibles(df_marg_pot):
+
+def obtener_mw_imposibles(df_marg_pot, dispersa=False):
     """Return the absolute value for negative values and 0 for
     positive values of the passed DataFrame.
+
+    Keyword arguments:
+    df_marg_pot -- Dataframe with the power margins.
+    dispersa -- if True, the columns are pandas sparse arrays that
+        only store the hours with impossible MW.
     """
+    if dispersa:
+        return crear_tabla_dispersa(
+            df_marg_pot,
+            lambda margen: np.where(margen > 0, 0, np.abs(margen)),
+            0.0,
+        )
     return df_marg_pot.mask(df_marg_pot>0,0).abs()
 
 
-def obtener_horas_imposibles(df_marg_pot):
+def obtener_horas_imposibles(df_marg_pot, dispersa=False):
     """Return True if the margin is negative and False if the margin is
     positive.
+
+    Keyword arguments:
+    df_marg_pot -- Dataframe with the power margins.
+    dispersa -- if True, the columns are pandas sparse arrays that
+        only store the impossible hours.
     """
+    if dispersa:
+        return crear_tabla_dispersa(
+            df_marg_pot, lambda margen: margen < 0, False)
     return df_marg_pot<0
 
 
 def obtener_beneficio_extra(df_mw_imp,df_mercado):
     """Multiply the impossible MWs by the BRS price at that hour
-    to compute the extra profit obtained.
+    to compute the extra profit obtained. Sparse impossible MW give
+    sparse profits.
 
     Keyword arguments:
     df_marg_pot -- Dataframe with the extra MW for each hour.
     df_mercado -- Dataframe with market data.   
     """
-    df_beneficio = df_mw_imp.copy()
-    for column in df_beneficio.columns:
-        df_beneficio.loc[:,column] = (
-            df_beneficio.loc[:,column] 
-            * df_mercado['Precio mercado SPOT Diario']
-        )
-    return df_beneficio
+    precio = df_mercado['Precio mercado SPOT Diario'].reindex(
+        df_mw_imp.index)
+    return df_mw_imp.mul(precio, axis=0)
+
+
+# Relative variance below which a series is taken as constant.
+TOLERANCIA_VARIANZA = 1e-12
+
+
+def obtener_estadisticos_correlacion(X, Y, pesos=None):
+    """Return the sums needed to compute the correlation between every
+    column of X and every column of Y, leaving out the rows where any
+    of the two values is missing. Every element is an array with a
+    row per column of X and a column per column of Y:
+    n -- number of rows with both values.
+    sx, sy -- sum of the values of X and Y.
+    sxx, syy -- sum of the squared values of X and Y.
+    sxy -- sum of the products of the values of X and Y.
+    The sums of different blocks of rows can be added up.
+
+    Keyword arguments:
+    X -- array of (rows, series)
+    Y -- array of (rows, market indicators), or of (resamples, rows,
+        market indicators) to get the sums of every resample at once.
+    pesos -- array of (resamples, rows) with the number of times every
+        row is counted in every resample (every row counts once if
+        None).
+    """
+    presentes_x = ~np.isnan(X)
+    presentes_y = ~np.isnan(Y)
+    X = np.where(presentes_x, X, 0)
+    Y = np.where(presentes_y, Y, 0)
+    presentes_x = presentes_x.astype(float)
+    presentes_y = presentes_y.astype(float)
+    lado_x = {
+        'n': presentes_x, 'sx': X, 'sy': presentes_x,
+        'sxx': X**2, 'syy': presentes_x, 'sxy': X,
+    }
+    lado_y = {
+        'n': presentes_y, 'sx': presentes_y, 'sy': Y,
+        'sxx': presentes_y, 'syy': Y**2, 'sxy': Y,
+    }
+    if pesos is not None:
+        lado_y = {
+            clave: pesos[..., None]*valores
+            for clave,valores in lado_y.items()
+        }
+    return {clave: lado_x[clave].T @ lado_y[clave] for clave in lado_x}
+
+
+def calcular_correlacion(estadisticos):
+    """Return the Pearson correlation from the sums returned by
+    obtener_estadisticos_correlacion. It is missing when there are
+    less than 2 rows or one of the series is constant, taking as
+    constant the variances lost in the rounding errors of the sums.
+    """
+    n = estadisticos['n']
+    covarianza = n*estadisticos['sxy'] - estadisticos['sx']*estadisticos['sy']
+    varianza_x = n*estadisticos['sxx'] - estadisticos['sx']**2
+    varianza_y = n*estadisticos['syy'] - estadisticos['sy']**2
+    validos = (
+        (n >= 2)
+        & (varianza_x > TOLERANCIA_VARIANZA*n*estadisticos['sxx'])
+        & (varianza_y > TOLERANCIA_VARIANZA*n*estadisticos['syy'])
+    )
+    correlacion = np.full(n.shape, np.nan)
+    correlacion[validos] = covarianza[validos] / np.sqrt(
+        varianza_x[validos] * varianza_y[validos])
+    return correlacion
+
+
+def preparar_series_correlacion(df, metodo='pearson'):
+    """Return the values of the dataframe as a float array ready to be
+    correlated: ranked by column for the Spearman method and centered
+    on the mean of every column, which does not change the correlation
+    but keeps the sums small.
+    """
+    if metodo == 'spearman':
+        df = df.rank()
+    elif metodo != 'pearson':
+        raise ValueError(
+            'Unknown correlation method "{}".'.format(metodo))
+    valores = df.to_numpy(dtype=float)
+    medias = np.nanmean(valores, axis=0)
+    return valores - np.nan_to_num(medias)
+
+
+def desplazar_filas(valores, retardo):
+    """Return the array moved retardo rows down (up if negative),
+    filling the rows left empty with missing values.
+    """
+    if retardo == 0:
+        return valores
+    desplazados = np.full(valores.shape, np.nan)
+    if retardo > 0:
+        desplazados[retardo:] = valores[:-retardo]
+    else:
+        desplazados[:retardo] = valores[-retardo:]
+    return desplazados
+
+
+# Names given to the data correlated with the market information.
+NOMBRES_CORRELACIONES = [
+    'MW imposibles',
+    'Horas imposibles',
+    'Beneficios imposibles',
+]
+
+# Statistics given for every correlation when its significance is
+# computed.
+ESTADISTICOS_SIGNIFICACION = [
+    'Correlación', 'Límite inferior', 'Límite superior', 'p-valor',
+]
+
+# Bytes that the arrays of all the batches of resamples computed at
+# the same time may take, adding up every worker process.
+MEMORIA_REMUESTREOS = 2**30
+
+# Series shared with the worker processes computing resamples, set
+# by iniciar_remuestreos in every worker process.
+datos_remuestreos = {}
+
+
+def iniciar_remuestreos(X, Y, correlacion, longitud_bloque):
+    """Keep in a worker process the data that calcular_remuestreos
+    works on, so it is not sent again with every batch of resamples.
+    Only used as the initializer of the worker processes, as every
+    process has its own copy of datos_remuestreos.
+    """
+    datos_remuestreos['X'] = X
+    datos_remuestreos['Y'] = Y
+    datos_remuestreos['correlacion'] = correlacion
+    datos_remuestreos['longitud_bloque'] = longitud_bloque
+
+
+def calcular_remuestreos_proceso(semillas):
+    """Run calcular_remuestreos in a worker process on the data set by
+    iniciar_remuestreos.
+    """
+    return calcular_remuestreos(semillas, **datos_remuestreos)
+
+
+def obtener_memoria_remuestreo(X, Y):
+    """Return an estimate of the bytes taken by the arrays of every
+    resample computed by calcular_remuestreos: the weighted and the
+    permuted market data with their masks and squares, the sums of
+    every pair of columns and the rows drawn.
+    """
+    n_filas, n_indicadores = Y.shape
+    n_series = X.shape[1]
+    return 8*(7*n_filas*n_indicadores + 6*n_series*n_indicadores
+              + 3*n_filas)
+
 
+def calcular_remuestreos(semillas, X, Y, correlacion, longitud_bloque):
+    """Compute a batch of block bootstrap and block permutation
+    resamples. Return a tuple with: (bootstrap correlations as an
+    array of (resamples, series, market indicators), number of
+    permutations whose correlation is at least as far from 0 as the
+    observed one, number of permutations with a correlation).
 
-def obtener_correlaciones(df_mercado,dic_df):
+    The bootstrap joins blocks of consecutive hours starting at random
+    hours and the permutation shuffles the order of the blocks of the
+    market data, so both keep the dependence between close hours.
+    Every resample has its own random generator, so the results do
+    not depend on how the resamples are split in batches.
+
+    Keyword arguments:
+    semillas -- list with the seed of every resample of the batch.
+    X -- array of (rows, series)
+    Y -- array of (rows, market indicators)
+    correlacion -- array of (series, market indicators) with the
+        observed correlations.
+    longitud_bloque -- number of consecutive hours of every block.
+    """
+    n_remuestreos = len(semillas)
+    n_filas = len(X)
+    longitud_bloque = min(longitud_bloque, n_filas)
+    n_bloques = -(-n_filas // longitud_bloque)
+    desplazamientos = np.arange(longitud_bloque)
+    generadores = [np.random.default_rng(semilla) for semilla in semillas]
+
+    # Block bootstrap: every row is weighted by the number of times it
+    # is drawn.
+    inicios = np.stack([
+        generador.integers(0, n_filas - longitud_bloque + 1, size=n_bloques)
+        for generador in generadores
+    ])
+    filas = (inicios[..., None] + desplazamientos).reshape(
+        n_remuestreos, -1)[:, :n_filas]
+    filas = filas + n_filas*np.arange(n_remuestreos)[:, None]
+    pesos = np.bincount(
+        filas.ravel(), minlength=n_remuestreos*n_filas,
+    ).reshape(n_remuestreos, n_filas)
+    correlaciones_bootstrap = calcular_correlacion(
+        obtener_estadisticos_correlacion(X, Y, pesos))
+
+    # Block permutation of the market data.
+    orden = np.stack([
+        generador.permutation(n_bloques) for generador in generadores])
+    filas = (orden[..., None]*longitud_bloque + desplazamientos).reshape(
+        n_remuestreos, -1)
+    filas = filas[filas < n_filas].reshape(n_remuestreos, n_filas)
+    correlaciones_permutacion = calcular_correlacion(
+        obtener_estadisticos_correlacion(X, Y[filas]))
+    validas = ~np.isnan(correlaciones_permutacion)
+    extremas = np.abs(correlaciones_permutacion) >= np.abs(correlacion) - 1e-12
+
+    return (
+        correlaciones_bootstrap,
+        (extremas & validas).sum(axis=0),
+        validas.sum(axis=0),
+    )
+
+
+def obtener_significacion_correlacion(
+        X, Y, correlacion, remuestreos, longitud_bloque=24,
+        nivel_confianza=0.95, procesos=1, semilla=None):
+    """Return a tuple with the (lower limit, upper limit) of the block
+    bootstrap confidence interval and the block permutation p-value of
+    the correlations between the columns of X and Y.
+
+    Keyword arguments:
+    X -- array of (rows, series)
+    Y -- array of (rows, market indicators)
+    correlacion -- array of (series, market indicators) with the
+        observed correlations.
+    remuestreos -- number of bootstrap and permutation resamples.
+    longitud_bloque -- number of consecutive hours of every block.
+    nivel_confianza -- confidence level of the interval.
+    procesos -- number of worker processes computing the resamples.
+    semilla -- seed or numpy SeedSequence of the random generators.
+    """
+    # Resamples are computed in batches small enough to keep the arrays
+    # of the batches of every process within MEMORIA_REMUESTREOS.
+    tamano_lote = max(1, MEMORIA_REMUESTREOS // (
+        max(procesos, 1)*obtener_memoria_remuestreo(X, Y)))
+    if not isinstance(semilla, np.random.SeedSequence):
+        semilla = np.random.SeedSequence(semilla)
+    semillas = semilla.spawn(remuestreos)
+    lotes = [
+        semillas[inicio:inicio + tamano_lote]
+        for inicio in range(0, remuestreos, tamano_lote)
+    ]
+
+    if procesos > 1:
+        with ProcessPoolExecutor(
+                max_workers=procesos, initializer=iniciar_remuestreos,
+                initargs=(X, Y, correlacion, longitud_bloque)) as executor:
+            resultados = list(
+                executor.map(calcular_remuestreos_proceso, lotes))
+    else:
+        resultados = [
+            calcular_remuestreos(
+                lote, X, Y, correlacion, longitud_bloque)
+            for lote in lotes
+        ]
+
+    correlaciones_bootstrap = np.concatenate(
+        [resultado[0] for resultado in resultados])
+    extremas = sum(resultado[1] for resultado in resultados)
+    validas = sum(resultado[2] for resultado in resultados)
+
+    alfa = (1 - nivel_confianza)/2
+    with np.errstate(invalid='ignore'):
+        inferior, superior = np.nanquantile(
+            correlaciones_bootstrap, [alfa, 1 - alfa], axis=0)
+    p_valor = (extremas + 1)/(validas + 1)
+    p_valor[np.isnan(correlacion)] = np.nan
+
+    return inferior, superior, p_valor
+
+
+# Number of columns of a sparse table made dense at the same time to
+# compute its correlations.
+COLUMNAS_BLOQUE_DISPERSO = 256
+
+
+def obtener_bloques_columnas(df):
+    """Return a list of slices of the columns of the dataframe to be
+    made dense at the same time: a single slice with every column for
+    dense tables and blocks of COLUMNAS_BLOQUE_DISPERSO columns if any
+    of them is sparse.
+    """
+    if not any(isinstance(tipo, pd.SparseDtype) for tipo in df.dtypes):
+        return [slice(None)]
+    return [
+        slice(inicio, inicio + COLUMNAS_BLOQUE_DISPERSO)
+        for inicio in range(0, len(df.columns), COLUMNAS_BLOQUE_DISPERSO)
+    ]
+
+
+def obtener_correlaciones(df_mercado, dic_df, metodo='pearson',
+                          retardos=None, remuestreos=0,
+                          longitud_bloque=24, nivel_confianza=0.95,
+                          procesos=1, semilla=None):
+    """Compute the correlation between every column of the dataframes
+    passed and every market indicator. Return a dataframe with the
+    columns of the dataframes as rows and a column for every pair of
+    dataframe and market indicator (and lag if retardos is passed, and
+    statistic if remuestreos is passed).
+
+    Every dataframe and the market data are centered once and all
+    their correlations are obtained with a few matrix products.
+    Missing values are left out pair by pair. Sparse dataframes are
+    made dense by blocks of columns.
+
+    Keyword arguments:
+    df_mercado -- dataframe with market data.
+    dic_df -- dictionary with the name of the data as key and the
+        dataframe as value.
+    metodo -- 'pearson' or 'spearman'. With 'spearman' every column
+        is ranked on its own before leaving out missing values.
+    retardos -- list of lags in hours. With lag k every value is
+        correlated with the market value k hours before it. Only lag
+        0 is computed if None.
+    remuestreos -- number of resamples used to compute the block
+        bootstrap confidence interval and the block permutation
+        p-value of every correlation. Not computed if 0.
+    longitud_bloque -- number of consecutive hours of every resampled
+        block. It should cover the hours the data depend on.
+    nivel_confianza -- confidence level of the intervals.
+    procesos -- number of worker processes computing the resamples.
+    semilla -- seed of the resamples, for reproducible results.
+    """
     lista_correlaciones = []
     lista_nombres_df = list(dic_df.keys())
+    lista_retardos = [0] if retardos is None else list(retardos)
+    semillas = np.random.SeedSequence(semilla)
 
     # Progress bar
-    l_d = len(dic_df)
-    l_m = len(df_mercado.columns)
-    l_tot = l_d * l_m
+    l_tot = len(dic_df)
     print_progress(
         0, l_tot, prefix='Creating correlations table:', 
         suffix='Complete',
     )
     for i,(_,df) in enumerate(dic_df.items()):
-        for j,column in enumerate(df_mercado.columns):
-            lista_correlaciones.append(df.corrwith(df_mercado[column]))
-            print_progress(
-                i*l_m+j+1, l_tot, prefix='Creating correlations table:',
-                suffix='Complete',
-            )
+        Y = preparar_series_correlacion(
+            df_mercado.reindex(df.index), metodo)
+        lista_bloques = []
+        for bloque in obtener_bloques_columnas(df):
+            df_bloque = df.iloc[:, bloque]
+            X = preparar_series_correlacion(df_bloque, metodo)
+            correlaciones = []
+            for retardo in lista_retardos:
+                Y_retardo = desplazar_filas(Y, retardo)
+                correlacion = calcular_correlacion(
+                    obtener_estadisticos_correlacion(X, Y_retardo))
+                estadisticos = [correlacion]
+                if remuestreos:
+                    estadisticos.extend(obtener_significacion_correlacion(
+                        X, Y_retardo, correlacion, remuestreos,
+                        longitud_bloque, nivel_confianza, procesos,
+                        semillas.spawn(1)[0],
+                    ))
+                correlaciones.append(np.stack(estadisticos, axis=-1))
+            correlaciones = np.stack(correlaciones, axis=2)
+            lista_bloques.append(pd.DataFrame(
+                correlaciones.reshape(len(df_bloque.columns), -1),
+                index=df_bloque.columns,
+            ))
+        lista_correlaciones.append(pd.concat(lista_bloques))
+        print_progress(
+            i+1, l_tot, prefix='Creating correlations table:',
+            suffix='Complete',
+        )
 
     df_corr = pd.concat(lista_correlaciones,axis=1)
-    df_corr.columns = pd.MultiIndex.from_product(
-        [lista_nombres_df,
-        df_mercado.columns]
-    )
-    df_corr.columns.names = ['Elemento 1', 'Elemento 2']
+    niveles = [lista_nombres_df, df_mercado.columns]
+    nombres_niveles = ['Elemento 1', 'Elemento 2']
+    if retardos is not None:
+        niveles.append(lista_retardos)
+        nombres_niveles.append('Retardo')
+    if remuestreos:
+        niveles.append(ESTADISTICOS_SIGNIFICACION)
+        nombres_niveles.append('Estadístico')
+    df_corr.columns = pd.MultiIndex.from_product(niveles)
+    df_corr.columns.names = nombres_niveles
     df_corr.index.names = ['Empresa', 'Planificación','BRS', 'Extremo']
 
     return df_corr
 
+
+def obtener_ventanas_dias(dias, ventana):
+    """Return the position of the first and last day (both included)
+    of every window and the date that labels it.
+
+    Keyword arguments:
+    dias -- DatetimeIndex with every day of the period.
+    ventana -- number of days of a rolling window, labelled by its
+        last day, or a pandas period frequency such as 'M' for
+        calendar windows, labelled by their first day.
+    """
+    if isinstance(ventana, int):
+        fin = np.arange(ventana - 1, len(dias))
+        inicio = fin - ventana + 1
+        return inicio, fin, dias[fin]
+    periodos = dias.to_period(ventana)
+    cambios = np.flatnonzero(periodos[1:] != periodos[:-1]) + 1
+    inicio = np.r_[0, cambios]
+    fin = np.r_[cambios - 1, len(dias) - 1]
+    return inicio, fin, dias[inicio]
+
+
+def acumular_por_dias(valores, posiciones, n_dias):
+    """Return the cumulative sum over days of the values of every
+    column, with a first row of zeros, so that the sum between days a
+    and b (both included) is the row b+1 minus the row a.
+
+    Keyword arguments:
+    valores -- array of (hours, series).
+    posiciones -- sorted day position of every hour.
+    n_dias -- number of days of the period.
+    """
+    acumulado = np.zeros((n_dias + 1, valores.shape[1]))
+    cambios = np.flatnonzero(np.r_[True, posiciones[1:] != posiciones[:-1]])
+    acumulado[posiciones[cambios] + 1] = np.add.reduceat(
+        valores, cambios, axis=0)
+    return np.cumsum(acumulado, axis=0)
+
+
+def obtener_correlaciones_ventana(df_mercado, dic_df, ventana=30):
+    """Compute the Pearson correlation between every column of the
+    dataframes passed and every market indicator over consecutive
+    windows of days. Return a dataframe with a 'Correlación' column
+    indexed by the date of the window, the names of the data and
+    market indicator and the levels of the columns of the dataframes.
+    Windows where the correlation cannot be computed are left out.
+
+    The sums used by the correlation are accumulated day by day once,
+    so every window is obtained from the difference of two rows
+    however many days it spans.
+
+    Keyword arguments:
+    df_mercado -- dataframe with market data.
+    dic_df -- dictionary with the name of the data as key and the
+        dataframe as value.
+    ventana -- number of days of a rolling window, or a pandas period
+        frequency ('M' for calendar months).
+    """
+    lista_correlaciones = []
+
+    # Progress bar
+    l_tot = len(dic_df)
+    print_progress(
+        0, l_tot, prefix='Creating windowed correlations table:',
+        suffix='Complete',
+    )
+    for i,(nombre,df) in enumerate(dic_df.items()):
+        Y = preparar_series_correlacion(df_mercado.reindex(df.index))
+        dias_horas = pd.DatetimeIndex(df.index).tz_localize(None).normalize()
+        dias = pd.date_range(dias_horas[0], dias_horas[-1], freq='D')
+        posiciones = dias.searchsorted(dias_horas)
+        inicio, fin, fechas = obtener_ventanas_dias(dias, ventana)
+        for bloque in obtener_bloques_columnas(df):
+            df_bloque = df.iloc[:, bloque]
+            X = preparar_series_correlacion(df_bloque)
+            presentes_x = ~np.isnan(X)
+            X = np.where(presentes_x, X, 0)
+            n_filas = len(fechas)*len(df_bloque.columns)
+            niveles_series = [
+                np.tile(df_bloque.columns.get_level_values(k), len(fechas))
+                for k in range(df_bloque.columns.nlevels)
+            ]
+            for j,indicador in enumerate(df_mercado.columns):
+                presentes_y = ~np.isnan(Y[:, [j]])
+                y = np.where(presentes_y, Y[:, [j]], 0)
+                sumandos = {
+                    'n': presentes_x & presentes_y,
+                    'sx': X*presentes_y,
+                    'sy': presentes_x*y,
+                    'sxx': X**2*presentes_y,
+                    'syy': presentes_x*y**2,
+                    'sxy': X*y,
+                }
+                estadisticos = {}
+                for clave,valores in sumandos.items():
+                    acumulado = acumular_por_dias(
+                        valores.astype(float), posiciones, len(dias))
+                    estadisticos[clave] = (
+                        acumulado[fin + 1] - acumulado[inicio])
+                estadisticos['n'] = np.rint(estadisticos['n'])
+                correlacion = pd.Series(
+                    calcular_correlacion(estadisticos).ravel(),
+                    index=pd.MultiIndex.from_arrays(
+                        [np.repeat(fechas, len(df_bloque.columns)),
+                         np.full(n_filas, nombre, dtype=object),
+                         np.full(n_filas, indicador, dtype=object)]
+                        + niveles_series
+                    ),
+                )
+                lista_correlaciones.append(correlacion.dropna())
+        print_progress(
+            i+1, l_tot, prefix='Creating windowed correlations table:',
+            suffix='Complete',
+        )
+
+    df_corr = pd.concat(lista_correlaciones).to_frame('Correlación')
+    df_corr.index.names = [
+        'Fecha', 'Elemento 1', 'Elemento 2',
+        'Empresa', 'Planificación', 'BRS', 'Extremo',
+    ]
+
+    return df_corr
+
+
+def obtener_particiones_tiempo(horas, frecuencia='Y'):
+    """Return a list with a tuple (name, first hour, hour after the
+    last one) for every calendar period with some of the hours passed,
+    so gaps in the data do not give empty partitions.
+
+    Keyword arguments:
+    horas -- DatetimeIndex with the hours of a table.
+    frecuencia -- pandas period frequency, 'Y' for years or 'M' for
+        months.
+    """
+    horas_locales = pd.DatetimeIndex(horas).tz_localize(None)
+    periodos = horas_locales.to_period(frecuencia).unique().sort_values()
+    particiones = []
+    for periodo in periodos:
+        inicio = periodo.start_time
+        fin = (periodo + 1).start_time
+        if horas.tz is not None:
+            inicio = inicio.tz_localize(horas.tz)
+            fin = fin.tz_localize(horas.tz)
+        particiones.append((str(periodo), inicio, fin))
+    return particiones
+
+
+def leer_tabla_particionada(carpeta_de_informacion, nombre_tabla,
+                            seleccion=None):
+    """Read and join in time order every partition of a table stored
+    by procesar_por_particiones.
+
+    Keyword arguments:
+    carpeta_de_informacion -- Path to the folder with the tables.
+    nombre_tabla -- name of the table, like 'tabla_mw_imposibles_empresas'.
+    seleccion -- list with, for every column level, a list of the
+        values to read or None to read all of them.
+    """
+    carpeta_tabla = carpeta_de_informacion+'particiones/'+nombre_tabla+'/'
+    return pd.concat([
+        leer_tabla_columnar(carpeta_tabla+archivo, seleccion=seleccion)
+        for archivo in sorted(os.listdir(carpeta_tabla))
+        if archivo.endswith('.parquet')
+    ])
+
+
+def procesar_por_particiones(carpeta_de_informacion, centrales_en_empresa,
+                             df_mercado, frecuencia='Y'):
+    """Compute the power margins, impossible MW and hours and extra
+    profit of the Unidades de Programación and companies one period
+    of time at a time, so only one period of the power table is kept
+    in memory. Every table is stored by period in the folder
+    'particiones' of the information folder (see
+    leer_tabla_particionada). Return a tuple with the correlation
+    tables of the companies and the Unidades de Programación, as
+    obtener_correlaciones returns them.
+
+    The sums the correlations are computed from are added period by
+    period. Every series is shifted by its mean over the first period
+    to keep the sums small, which does not change the correlation.
+
+    Keyword arguments:
+    carpeta_de_informacion -- Path to the folder with the tables. The
+        power table must be stored as Parquet.
+    centrales_en_empresa -- Dictionary with companies as keys and a
+        list of their Unidades de Programacion as values.
+    df_mercado -- dataframe with market data.
+    frecuencia -- pandas period frequency of the partitions, 'Y' for
+        years or 'M' for months.
+    """
+    carpeta_particiones = carpeta_de_informacion+'particiones/'
+    particiones = obtener_particiones_tiempo(
+        leer_horas_tabla_columnar(
+            carpeta_de_informacion+'tabla_potencia_agregada.parquet'),
+        frecuencia,
+    )
+    referencias = {}
+    sumas = {}
+    columnas = {}
+
+    # Progress bar
+    l_tot = len(particiones)
+    print_progress(
+        0, l_tot, prefix='Processing partitions:', suffix='Complete')
+    for i,(nombre_particion,inicio,fin) in enumerate(particiones):
+        df_potencias = leer_tabla_potencia(
+            carpeta_de_informacion, inicio=inicio, fin=fin)
+        df_margenes = calcular_margenes_potencia(df_potencias)
+        df_margenes_empresas = agregar_margenes_potencia(
+            df_margenes, centrales_en_empresa)
+        df_mercado_particion = df_mercado.reindex(df_margenes.index)
+        Y = df_mercado_particion.to_numpy(dtype=float)
+        tablas = {
+            'tabla_margenes_potencia_up': df_margenes,
+            'tabla_margenes_potencia_empresas': df_margenes_empresas,
+        }
+        for grupo,df_marg_pot in [('centrales', df_margenes),
+                                  ('empresas', df_margenes_empresas)]:
+            df_mw_imp = obtener_mw_imposibles(df_marg_pot)
+            datos = dict(zip(NOMBRES_CORRELACIONES, [
+                df_mw_imp,
+                obtener_horas_imposibles(df_marg_pot),
+                obtener_beneficio_extra(df_mw_imp, df_mercado_particion),
+            ]))
+            for nombre_tabla,df in zip(
+                    ['tabla_mw_imposibles_', 'tabla_horas_imposibles_',
+                     'tabla_beneficio_extra_'],
+                    datos.values()):
+                tablas[nombre_tabla+grupo] = df
+
+            for nombre,df in datos.items():
+                X = df.to_numpy(dtype=float)
+                clave = (grupo, nombre)
+                if clave not in referencias:
+                    referencias[clave] = (
+                        np.nan_to_num(np.nanmean(X, axis=0)),
+                        np.nan_to_num(np.nanmean(Y, axis=0)),
+                    )
+                    columnas[clave] = df.columns
+                estadisticos = obtener_estadisticos_correlacion(
+                    X - referencias[clave][0], Y - referencias[clave][1])
+                if clave in sumas:
+                    estadisticos = {
+                        estadistico: sumas[clave][estadistico] + valor
+                        for estadistico,valor in estadisticos.items()
+                    }
+                sumas[clave] = estadisticos
+
+        for nombre_tabla,df in tablas.items():
+            os.makedirs(carpeta_particiones+nombre_tabla, exist_ok=True)
+            guardar_tabla_columnar(
+                df,
+                carpeta_particiones+nombre_tabla+'/'
+                +nombre_particion+'.parquet',
+            )
+        print_progress(
+            i+1, l_tot, prefix='Processing partitions:', suffix='Complete')
+
+    resultados = []
+    for grupo in ['empresas', 'centrales']:
+        df_corr = pd.concat(
+            [pd.DataFrame(
+                calcular_correlacion(sumas[(grupo, nombre)]),
+                index=columnas[(grupo, nombre)],
+            ) for nombre in NOMBRES_CORRELACIONES],
+            axis=1,
+        )
+        df_corr.columns = pd.MultiIndex.from_product(
+            [NOMBRES_CORRELACIONES, df_mercado.columns],
+            names=['Elemento 1', 'Elemento 2'],
+        )
+        df_corr.index.names = ['Empresa', 'Planificación','BRS', 'Extremo']
+        resultados.append(df_corr)
+
+    return tuple(resultados)
@@ -6,6 +6,8 @@ import fnmatch
 import os
 
 import funciones_lectura as f
+import funciones_procesado as fp
+from funciones_auxiliares import guardar_tabla_columnar
 
 
 # Path to the folders that are going to be used. The raw power data 
@@ -20,6 +22,24 @@ carpeta_de_datos_mercado = ("/home/alejandro/Documentos/"
 carpeta_de_informacion = ("/home/alejandro/Documentos/Universidad/"
     "MII_2/TFM/TrabajoConDatos/informacion_procesada/")
 
+# Number of processes used to read the I90DIA files in parallel. The
+# pool relies on the 'fork' start method used by default on Linux.
+procesos = os.cpu_count()
+
+# In incremental mode only the I90DIA files that are not in the
+# manifest of the information folder, or that have changed since they
+# were read, are processed and merged into the stored tables.
+modo_incremental = True
+
+# The parsed sheets of the I90DIA files are cached in this folder, so
+# changes in the processing do not require parsing the workbooks
+# again. The least recently used sheets are removed when the cache
+# grows over its maximum size (bytes). If the way the sheets are
+# parsed changes, increase VERSION_CACHE_I90DIA in funciones_lectura.
+carpeta_cache = carpeta_de_informacion + 'cache_i90dia/'
+tamano_maximo_cache = 5 * 1024**3
+os.makedirs(carpeta_cache, exist_ok=True)
+
 # List of files to process (I90DIA).
 files_list = (
     sorted(fnmatch.filter(os.listdir(carpeta_de_datos_potencia),'I90DIA*.xls')))
@@ -37,67 +57,105 @@ end_date = (
     + files_list[-1][13:15]
 )
 
-# Get list of 'unidades de programación' that participated in the
-# 'Banda de Resolución Secundaria' bidding in the period of the data.
-participantes_secundaria = f.obtener_ofertantes_secundaria(
-    carpeta_de_datos_potencia,files_list
-)
-pd.Series(participantes_secundaria).to_csv(
-    carpeta_de_informacion+'participantes_secundaria.csv',
-    sep=';', header=['Unidad de programación'],
-)
+# Select the I90DIA files to read. The stored tables are only
+# reused in incremental mode when a previous run left its manifest.
+df_manifiesto = f.leer_manifiesto(carpeta_de_informacion)
+if modo_incremental and not df_manifiesto.empty:
+    files_pendientes = f.obtener_archivos_pendientes(
+        carpeta_de_datos_potencia, files_list, df_manifiesto,
+    )
+    participantes_previos = fp.leer_participantes_secundaria(
+        carpeta_de_informacion,
+    )
+    df_potencias_previas = fp.leer_tabla_potencia(carpeta_de_informacion)
+    print('{} new or modified I90DIA files found.'.format(
+        len(files_pendientes)))
+else:
+    files_pendientes = files_list
+    participantes_previos = []
+    df_potencias_previas = None
 
-# Import all relevant data concerning the bidders from the I90DIA
-# files.
-print('Reading raw data:')
-df_pvp = f.obtener_pvp(
-    participantes_secundaria=participantes_secundaria,
-    carpeta=carpeta_de_datos_potencia,
-    files_list=files_list,
-)
-(df_brs_ofertada_subir, 
-df_brs_ofertada_bajar, 
-df_brs_ofertas_detalladas) = (
-    f.obtener_brs_ofertada(
+if files_pendientes:
+    # Import all relevant data concerning the BRS bidders from the
+    # I90DIA files. Every file is opened only once and all the sheets
+    # needed are read from it. The list of 'unidades de programación'
+    # that participated in the 'Banda de Resolución Secundaria'
+    # bidding in the period of the data is obtained in the same pass.
+    # The files are spread across a pool of processes.
+    print('Reading raw data:')
+    (participantes_secundaria,
+    df_pvp,
+    df_brs_ofertada_subir,
+    df_brs_ofertada_bajar,
+    df_brs_ofertas_detalladas,
+    df_brs_casada_subir,
+    df_brs_casada_bajar,
+    df_p48) = f.obtener_datos_i90dia(
         carpeta=carpeta_de_datos_potencia,
-        files_list=files_list,
-))
-df_brs_casada_subir, df_brs_casada_bajar = f.obtener_brs_casada(
-    carpeta=carpeta_de_datos_potencia,
-    files_list=files_list,
-)
-df_p48 = f.obtener_p48(
-    participantes_secundaria=participantes_secundaria,
-    carpeta=carpeta_de_datos_potencia,
-    files_list=files_list,
-)
-df_pot_max, df_pot_hab = f.obtener_pot_max(
-    start_date=start_date,
-    end_date=end_date,
-    participantes_secundaria=participantes_secundaria,
-)
-print('Todos los datos han sido importados con éxito')
-
-# Create a dataframe with all the information.
-print('Juntando toda la información en un único dataframe.')
-dict_dataframes = {
-    'PVP':df_pvp,
-    'BRS_of_sub':df_brs_ofertada_subir,
-    'BRS_of_baj':df_brs_ofertada_bajar,
-    'BRS_cas_sub':df_brs_casada_subir,
-    'BRS_cas_baj':df_brs_casada_bajar,
-    'P48':df_p48,
-    'pot_max':df_pot_max,
-    'pot_hab':df_pot_hab,
-}
-df_potencias = f.crear_tabla_ofertantes(dict_dataframes)
-
-# Store the dataframe with all power information in a csv table.
-df_potencias.to_csv(
-    path_or_buf=(carpeta_de_informacion+'tabla_potencia_agregada.csv'),
-    sep=';',
-)
-print('La información de potencia se ha guardado en un archivo CSV.')
+        files_list=files_pendientes,
+        procesos=procesos,
+        participantes_secundaria=participantes_previos,
+        carpeta_cache=carpeta_cache,
+    )
+    f.limitar_cache(carpeta_cache, tamano_maximo_cache)
+    pd.Series(participantes_secundaria).to_csv(
+        carpeta_de_informacion+'participantes_secundaria.csv',
+        sep=';', header=['Unidad de programación'],
+    )
+    df_pot_max, df_pot_hab = f.obtener_pot_max(
+        start_date=start_date,
+        end_date=end_date,
+        participantes_secundaria=participantes_secundaria,
+    )
+    print('Todos los datos han sido importados con éxito')
+
+    # Create a dataframe with all the information. In incremental
+    # mode the new days are merged with the stored ones first.
+    print('Juntando toda la información en un único dataframe.')
+    dict_dataframes = {
+        'PVP':df_pvp,
+        'BRS_of_sub':df_brs_ofertada_subir,
+        'BRS_of_baj':df_brs_ofertada_bajar,
+        'BRS_cas_sub':df_brs_casada_subir,
+        'BRS_cas_baj':df_brs_casada_bajar,
+        'P48':df_p48,
+        'pot_max':df_pot_max,
+        'pot_hab':df_pot_hab,
+    }
+    if df_potencias_previas is not None:
+        dict_dataframes = f.actualizar_datos_ofertantes(
+            df_potencias_previas, dict_dataframes,
+        )
+    df_potencias = f.crear_tabla_ofertantes(dict_dataframes)
+
+    # Store the dataframe with all power information in a csv table
+    # and in a Parquet file that allows reading only some columns.
+    df_potencias.to_csv(
+        path_or_buf=(carpeta_de_informacion+'tabla_potencia_agregada.csv'),
+        sep=';',
+    )
+    guardar_tabla_columnar(
+        df_potencias,
+        carpeta_de_informacion+'tabla_potencia_agregada.parquet',
+    )
+    print('La información de potencia se ha guardado en un archivo CSV.')
+
+    # Store the detailed BRS biddings in a dataset partitioned by
+    # direction and year that can be queried by Unidad de
+    # Programación, direction and dates without loading all of it.
+    f.guardar_ofertas_detalladas(
+        df_brs_ofertas_detalladas,
+        carpeta_de_informacion+'ofertas_brs/',
+    )
+    print('Las ofertas detalladas de BRS se han guardado.')
+
+    # Record the files read so that next runs skip them.
+    f.guardar_manifiesto(
+        f.crear_manifiesto(carpeta_de_datos_potencia, files_list),
+        carpeta_de_informacion,
+    )
+else:
+    print('No hay archivos I90DIA nuevos que procesar.')
 
 # Import data concerning the electricity market and store them
 # in a csv file.
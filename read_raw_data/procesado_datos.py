@@ -5,6 +5,7 @@ import sys
 import pandas as pd
 
 import funciones_procesado as f
+import funciones_grafo as g
 
 # Print execution start notice
 print('Executing data processing script...\n')
@@ -27,90 +28,77 @@ print(
      .format(carpeta_de_datos_centrales))
 )
 
-# Import list of Unidades de Programación participating in BRS 
-# biddings.
-participantes_secundaria = f.leer_participantes_secundaria(
+# Tables requested after the folders (the whole period correlation
+# tables if none). Only the tables needed to obtain them are computed,
+# e.g. "procesado_datos.py info/ centrales/ df_mw_imposibles_empresas".
+# The windowed correlation tables (df_corr_mensual_empresas and
+# df_corr_movil_empresas) are only computed when requested.
+tablas_pedidas = sys.argv[3:] or list(g.ARCHIVOS_SALIDA)
+print('Requested tables:\n{}\n'.format(', '.join(tablas_pedidas)))
+
+# Options to estimate the significance of every correlation, which
+# adds the level 'Estadístico' to the columns of the correlation
+# tables. It is not estimated if None. For example, with resampled
+# blocks of a week, as the hourly series depend on the previous hours:
+# opciones_significacion = {
+#     'remuestreos': 1000,
+#     'longitud_bloque': 24*7,
+#     'procesos': 4,
+#     'semilla': 0,
+# }
+opciones_significacion = None
+
+# Graph with every table of the processing stage: power margins by
+# Unidad de Programación and by company, impossible MW and hours,
+# extra profit from the MWs of dubious legality and their correlation
+# with some relevant market information.
+# Store the impossible MW and hours and the extra profit as sparse
+# columns, which only keep the impossible hours.
+tablas_dispersas = False
+
+grafo = g.crear_grafo_procesado(
     carpeta_de_informacion,
+    carpeta_de_datos_centrales,
+    opciones_significacion,
+    tablas_dispersas,
 )
 
-# Read information regarding company affiliation of all Unidades
-# de Programación and create dictionaries with it.
-(centrales_en_empresa, empresa_de_central) = (
-    f.obtener_empresa_centrales(
-        participantes_secundaria,
-        carpeta_de_datos_centrales
+# Period of the partitions in which the tables are processed one at a
+# time ('Y' for years or 'M' for months), keeping the memory used
+# flat however long the study period is. Only the correlation tables
+# are returned then, the rest are stored by partition. The whole
+# tables are processed at once if None.
+frecuencia_particiones = None
+
+# Tables computed at the same time. The significance estimate already
+# runs a pool of processes, so the tables are computed one at a time
+# then; otherwise independent tables run in threads.
+hilos = 1 if opciones_significacion else None
+
+if frecuencia_particiones is None:
+    tablas = g.calcular_nodos(grafo, tablas_pedidas, hilos=hilos)
+else:
+    tablas = g.calcular_nodos(
+        grafo, ['centrales_en_empresa', 'df_mercado'], hilos=hilos)
+    (tablas['df_corr_empresas'], tablas['df_corr_centrales']) = (
+        f.procesar_por_particiones(
+            carpeta_de_informacion,
+            tablas['centrales_en_empresa'],
+            tablas['df_mercado'],
+            frecuencia_particiones,
+        )
     )
-)
-
-# Import power table previously obtained.
-df_potencias = f.leer_tabla_potencia(carpeta_de_informacion)
-
-# Create table with the power margins of different combinations of
-# BRS and power dispatched.
-df_margenes_potencia = f.obtener_margenes_potencia(
-    df_potencias,
-    carpeta_de_informacion,
-)
-
-# Create table with the power margins of every company.
-df_margenes_potencia_empresas = f.obtener_margenes_potencia_empresas(
-    df_margenes_potencia,
-    centrales_en_empresa,
-    carpeta_de_informacion
-)
-
-# Create table with the ilicit MW per hour for companies and Unidades
-# de Programación.
-df_mw_imposibles_centrales = (
-    f.obtener_mw_imposibles(df_margenes_potencia)
-)
-df_mw_imposibles_empresas = (
-    f.obtener_mw_imposibles(df_margenes_potencia_empresas)
-)
 
-# Create table stating whether the power margin was impossible or not.
-# True if impossible.
-df_horas_imposibles_centrales = (
-    f.obtener_horas_imposibles(df_margenes_potencia)
-)
-df_horas_imposibles_empresas = (
-    f.obtener_horas_imposibles(df_margenes_potencia_empresas)
-)
-
-# Import electricity market information.
-df_mercado = f.leer_tabla_mercado(carpeta_de_informacion)
-
-# Compute extra profit from the MWs of dubious legality.
-df_ben_extra_centrales = (
-    f.obtener_beneficio_extra(df_mw_imposibles_centrales,df_mercado)
-)
-df_ben_extra_empresas = (
-    f.obtener_beneficio_extra(df_mw_imposibles_empresas,df_mercado)
-)
-
-# Obtain the correlation between these data and some relevant market
-# information.
-dic_df_empresas = {
-    'MW imposibles':df_mw_imposibles_empresas,
-    'Horas imposibles':df_horas_imposibles_empresas,
-    'Beneficios imposibles':df_ben_extra_empresas,
-}
-dic_df_centrales = {
-    'MW imposibles':df_mw_imposibles_centrales,
-    'Horas imposibles':df_horas_imposibles_centrales,
-    'Beneficios imposibles':df_ben_extra_centrales,
-}
-df_corr_empresas = f.obtener_correlaciones(df_mercado,dic_df_empresas)
-df_corr_empresas.to_csv(
-    carpeta_de_informacion+'correlaciones_empresas.csv',
-    sep=';'
-)
-df_corr_centrales = f.obtener_correlaciones(
-    df_mercado,dic_df_centrales,
-)
-df_corr_centrales.to_csv(
-    carpeta_de_informacion+'correlaciones_centrales.csv',
-    sep=';'
-)
+# Every table computed is left available with the name of its node,
+# as notebooks running this script use them.
+globals().update(tablas)
+
+archivos_salida = {**g.ARCHIVOS_SALIDA, **g.ARCHIVOS_SALIDA_VENTANAS}
+for nombre_tabla, archivo in archivos_salida.items():
+    if nombre_tabla in tablas:
+        tablas[nombre_tabla].to_csv(
+            carpeta_de_informacion+archivo,
+            sep=';'
+        )
 
 print('Task completed successfully.')
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules of read_raw_data are imported by the scripts as top level
+# modules, so the tests import them the same way.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
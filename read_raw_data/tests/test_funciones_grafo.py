@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+import funciones_grafo as g
+import funciones_procesado as f
+
+
+def crear_grafo_significacion():
+    generador = np.random.default_rng(0)
+    horas = pd.date_range(
+        '2016-01-01', periods=24*90, freq='H', tz='Europe/Madrid')
+    columnas = pd.MultiIndex.from_product(
+        [['A', 'B', 'C', 'D'], ['P48', 'PVP'], ['Casada'], ['Superior', 'Inferior']])
+    df_mercado = pd.DataFrame(
+        generador.normal(size=(len(horas), 3)), index=horas,
+        columns=['Precio', 'Requerimiento', 'Utilización'])
+    tablas = {
+        nombre: pd.DataFrame(
+            generador.normal(size=(len(horas), len(columnas)))
+            + df_mercado[['Precio']].to_numpy(),
+            index=horas, columns=columnas)
+        for nombre in ['df_empresas', 'df_centrales']
+    }
+
+    def correlaciones(df_mercado, df):
+        return f.obtener_correlaciones(
+            df_mercado, {'MW imposibles': df}, remuestreos=200,
+            longitud_bloque=24, semilla=0)
+
+    grafo = {
+        'df_mercado': (lambda: df_mercado, []),
+        'df_corr_empresas': (correlaciones, ['df_mercado', 'df_empresas']),
+        'df_corr_centrales': (correlaciones, ['df_mercado', 'df_centrales']),
+    }
+    for nombre, df in tablas.items():
+        grafo[nombre] = (lambda df=df: df, [])
+    return grafo
+
+
+def test_calcular_nodos_significacion_concurrente_igual_que_serie(
+        monkeypatch):
+    # Small batches, so the resamples of both nodes interleave.
+    monkeypatch.setattr(f, 'MEMORIA_REMUESTREOS', 2**22)
+    objetivos = ['df_corr_empresas', 'df_corr_centrales']
+    serie = g.calcular_nodos(crear_grafo_significacion(), objetivos)
+    concurrente = g.calcular_nodos(
+        crear_grafo_significacion(), objetivos, hilos=2)
+
+    for nombre in objetivos:
+        pd.testing.assert_frame_equal(concurrente[nombre], serie[nombre])
+        assert serie[nombre].notna().all().all()
+    assert not serie['df_corr_empresas'].equals(serie['df_corr_centrales'])
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+import funciones_lectura as f
+from funciones_auxiliares import obtener_horas_dia
+
+
+def crear_datos_dia(fecha, centrales, valor):
+    return pd.DataFrame(
+        valor, index=obtener_horas_dia(fecha), columns=centrales)
+
+
+def leer_dias(dias):
+    # Same merge as obtener_datos_i90dia: outer concatenation of the
+    # days of every type, filling the missing hours with 0.
+    return {
+        nombre: pd.concat(
+            [dia[nombre] for dia in dias], axis=0, join='outer',
+            sort=False).fillna(0)
+        for nombre in dias[0]
+    }
+
+
+def test_actualizar_datos_ofertantes_igual_que_lectura_completa():
+    dia_1 = {
+        'BRS_of_sub': crear_datos_dia('2016-03-26', ['A', 'B'], 1.0),
+        'BRS_cas_sub': crear_datos_dia('2016-03-26', ['A'], 2.0),
+    }
+    # C is a new bidder that is never selected, B disappears.
+    dia_2 = {
+        'BRS_of_sub': crear_datos_dia('2016-03-27', ['A', 'C'], 3.0),
+        'BRS_cas_sub': crear_datos_dia('2016-03-27', ['A'], 4.0),
+    }
+
+    df_completa = f.crear_tabla_ofertantes(leer_dias([dia_1, dia_2]))
+    df_incremental = f.crear_tabla_ofertantes(
+        f.actualizar_datos_ofertantes(
+            f.crear_tabla_ofertantes(leer_dias([dia_1])), dia_2))
+
+    pd.testing.assert_frame_equal(df_incremental, df_completa)
+    assert df_completa[('C', 'BRS_cas_sub')].isna().all()
+    assert (df_completa.loc['2016-03-26', ('C', 'BRS_of_sub')] == 0).all()
+
+
+def test_obtener_datos_mercado_cuartohorario(tmp_path):
+    instantes = pd.date_range(
+        '2016-01-01', periods=8, freq='15min', tz='Europe/Madrid')
+    datos = {
+        'energia.csv': 'Energía utilizada de Regulación Secundaria subir',
+        'precio.csv': 'Precio de Regulación Secundaria subir',
+    }
+    for archivo, nombre in datos.items():
+        pd.DataFrame({
+            'value': np.arange(1, 9, dtype=float),
+            'datetime': instantes.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'name': nombre,
+        }).to_csv(tmp_path / archivo, sep=';', index=False)
+
+    df_mercado = f.obtener_datos_mercado(
+        str(tmp_path) + '/', '2016-01-01', '2016-01-01')
+
+    assert df_mercado.shape == (24, 2)
+    np.testing.assert_allclose(
+        df_mercado[datos['energia.csv']].iloc[:3], [10, 26, 0])
+    np.testing.assert_allclose(
+        df_mercado[datos['precio.csv']].iloc[:3], [2.5, 6.5, 0])
+
+
+def crear_ofertas_detalladas(fecha, central):
+    horas = obtener_horas_dia(fecha)
+    return pd.DataFrame({
+        'Unidad de Programación': pd.Categorical([central] * len(horas)),
+        'Sentido': pd.Categorical(['Subir'] * len(horas)),
+        'Nº Oferta': np.full(len(horas), 40000, dtype='int32'),
+        'Bloque': np.ones(len(horas), dtype='int32'),
+        'Hora': horas,
+        'MW': np.ones(len(horas), dtype=np.float32),
+        '€/MWh': np.full(len(horas), 20, dtype=np.float32),
+    })
+
+
+def test_guardar_ofertas_detalladas_conserva_centrales_previas(tmp_path):
+    carpeta_ofertas = str(tmp_path) + '/'
+    df_primero = crear_ofertas_detalladas('2016-01-01', 'A')
+    f.guardar_ofertas_detalladas(df_primero, carpeta_ofertas)
+    f.guardar_ofertas_detalladas(
+        crear_ofertas_detalladas('2016-01-02', 'B'), carpeta_ofertas)
+
+    df_consulta = f.consultar_ofertas_detalladas(
+        carpeta_ofertas, centrales=['A'])
+
+    assert len(df_consulta) == len(df_primero)
+    assert (df_consulta['Unidad de Programación'] == 'A').all()
+    assert (df_consulta['Nº Oferta'] == 40000).all()
+    pd.testing.assert_index_equal(
+        pd.DatetimeIndex(df_consulta['Hora']).tz_convert('Europe/Madrid'),
+        pd.DatetimeIndex(df_primero['Hora']), check_names=False)
+    assert set(f.consultar_ofertas_detalladas(carpeta_ofertas)[
+        'Unidad de Programación']) == {'A', 'B'}
@@ -0,0 +1,247 @@
+import numpy as np
+import pandas as pd
+
+import funciones_procesado as f
+
+
+def test_calcular_margenes_potencia_igual_que_bucle_original():
+    # Hours with planning 0, missing pot_max, pot_hab and planning and
+    # negative offered bands.
+    datos = {
+        'PVP': [0, 50, 80, np.nan],
+        'P48': [0, 60, 0, 40],
+        'pot_max': [100, np.nan, 100, 100],
+        'pot_hab': [90, 90, np.nan, 90],
+        'BRS_cas_sub': [5, 10, 0, 5],
+        'BRS_cas_baj': [5, 10, 0, 5],
+        'BRS_of_sub': [-3, 20, 10, 0],
+        'BRS_of_baj': [-2, 15, 5, 10],
+    }
+    horas = pd.date_range(
+        '2016-03-27', periods=4, freq='H', tz='Europe/Madrid')
+    df_potencias = pd.DataFrame(
+        {('A', tipo): valores for tipo, valores in datos.items()},
+        index=horas, dtype=float)
+
+    # Output of the loop over Unidades de Programación, plannings and
+    # bands that computed the margins before.
+    esperados = {
+        ('P48', 'Casada', 'Superior'): [-5, 80, 0, 55],
+        ('P48', 'Casada', 'Inferior'): [-5, 50, 0, 35],
+        ('P48', 'Ofertada', 'Superior'): [3, 70, -10, 60],
+        ('P48', 'Ofertada', 'Inferior'): [2, 45, -5, 30],
+        ('PVP', 'Casada', 'Superior'): [-5, 80, 20, 85],
+        ('PVP', 'Casada', 'Inferior'): [-5, 40, 80, np.nan],
+        ('PVP', 'Ofertada', 'Superior'): [3, 70, 10, 90],
+        ('PVP', 'Ofertada', 'Inferior'): [2, 35, 75, np.nan],
+    }
+
+    df_margenes = f.calcular_margenes_potencia(df_potencias)
+
+    assert list(df_margenes.columns) == [
+        ('A',) + columna for columna in esperados]
+    for columna, valores in esperados.items():
+        np.testing.assert_allclose(
+            df_margenes[('A',) + columna].to_numpy(), valores)
+    pd.testing.assert_index_equal(df_margenes.index, horas)
+
+
+def crear_margenes(centrales, horas=None):
+    if horas is None:
+        horas = pd.date_range(
+            '2016-10-29', periods=72, freq='H', tz='Europe/Madrid')
+    columnas = pd.MultiIndex.from_product(
+        [centrales, f.PLANIFICACIONES, f.BANDAS, f.MARGENES])
+    valores = np.random.default_rng(0).normal(size=(len(horas), len(columnas)))
+    return pd.DataFrame(valores, index=horas, columns=columnas)
+
+
+def test_obtener_margenes_potencia_empresas_con_empresa_vacia(tmp_path):
+    carpeta = str(tmp_path) + '/'
+    df_margenes = crear_margenes(['A', 'B', 'C'])
+    # Unidades de Programación without a Zona de Regulación are grouped
+    # under a missing company with no Unidades de Programación.
+    centrales_en_empresa = {'E1': ['A', 'B'], 'E2': ['C'], np.nan: []}
+
+    df_calculada = f.obtener_margenes_potencia_empresas(
+        df_margenes, centrales_en_empresa, carpeta)
+    df_guardada = f.obtener_margenes_potencia_empresas(
+        df_margenes, centrales_en_empresa, carpeta)
+
+    df_esperada = f.agregar_margenes_potencia(
+        df_margenes, centrales_en_empresa)
+    pd.testing.assert_frame_equal(
+        df_calculada, df_esperada, check_names=False, check_freq=False)
+    pd.testing.assert_frame_equal(df_guardada, df_calculada)
+    assert (df_calculada[np.nan] == 0).all().all()
+
+
+def test_obtener_tabla_derivada_recalcula_solo_grupos_cambiados(tmp_path):
+    carpeta = str(tmp_path) + '/'
+    df_margenes = crear_margenes(['A', 'B'])
+    calculados = []
+
+    def calcular(centrales):
+        calculados.append(list(centrales))
+        return df_margenes.loc[:, df_margenes.columns.get_level_values(0)
+                               .isin(centrales)]
+
+    hashes = {'A': 'a', 'B': 'b'}
+    df_inicial = f.obtener_tabla_derivada(carpeta, 'tabla', hashes, calcular)
+    df_repetida = f.obtener_tabla_derivada(
+        carpeta, 'tabla', hashes, calcular)
+    df_cambiada = f.obtener_tabla_derivada(
+        carpeta, 'tabla', {'A': 'a', 'B': 'c'}, calcular)
+
+    assert calculados == [['A', 'B'], ['B']]
+    pd.testing.assert_frame_equal(df_repetida, df_inicial)
+    pd.testing.assert_frame_equal(df_cambiada, df_inicial)
+
+
+def crear_mercado(horas, generador):
+    df_mercado = pd.DataFrame(
+        generador.normal(size=(len(horas), 3)), index=horas,
+        columns=['Precio mercado SPOT Diario', 'Requerimiento', 'Constante'])
+    df_mercado['Constante'] = 5.0
+    df_mercado.iloc[::7, 1] = np.nan
+    return df_mercado
+
+
+def test_obtener_correlaciones_igual_que_pandas():
+    generador = np.random.default_rng(1)
+    horas = pd.date_range(
+        '2016-03-26', periods=24*4, freq='H', tz='Europe/Madrid')
+    df_mercado = crear_mercado(horas, generador)
+    df_margenes = crear_margenes(['A', 'B'], horas)
+    df_margenes.iloc[::5, 0] = np.nan
+    df_margenes.iloc[:, 1] = 1.0
+    df_margenes.iloc[:, 2] += df_mercado['Precio mercado SPOT Diario'] * 3
+
+    df_corr = f.obtener_correlaciones(df_mercado, {'MW': df_margenes})
+
+    for columna in df_margenes.columns:
+        for indicador in df_mercado.columns:
+            esperada = df_margenes[columna].corr(df_mercado[indicador])
+            obtenida = df_corr.loc[columna, ('MW', indicador)]
+            if np.isnan(esperada):
+                assert np.isnan(obtenida)
+            else:
+                assert abs(obtenida - esperada) < 1e-12
+    assert df_corr[('MW', 'Constante')].isna().all()
+    assert df_corr.loc[df_margenes.columns[1]].isna().all()
+
+
+def test_obtener_correlaciones_ventana_igual_que_rolling():
+    generador = np.random.default_rng(2)
+    horas = pd.date_range(
+        '2016-01-01', periods=24*10, freq='H', tz='Europe/Madrid')
+    df_mercado = crear_mercado(horas, generador)
+    df_margenes = crear_margenes(['A'], horas)
+    df_margenes.iloc[::5, 0] = np.nan
+    df_margenes.iloc[:, 2] += df_mercado['Precio mercado SPOT Diario']
+
+    df_corr = f.obtener_correlaciones_ventana(
+        df_mercado, {'MW': df_margenes}, ventana=3)
+
+    indicador = 'Precio mercado SPOT Diario'
+    for columna in df_margenes.columns[[0, 2, 3]]:
+        # Correlation over the 72 hours ending at the last hour of
+        # every day, labelled by that day.
+        esperada = df_margenes[columna].rolling(24*3, min_periods=2).corr(
+            df_mercado[indicador]).iloc[24*3 - 1::24]
+        esperada.index = esperada.index.tz_localize(None).normalize()
+        obtenida = df_corr.xs(
+            ('MW', indicador) + columna,
+            level=['Elemento 1', 'Elemento 2', 'Empresa',
+                   'Planificación', 'BRS', 'Extremo'],
+        )['Correlación']
+        assert len(obtenida) == 8
+        np.testing.assert_allclose(
+            obtenida.to_numpy(), esperada.to_numpy(), rtol=0, atol=1e-12)
+        assert (obtenida.index == esperada.index).all()
+
+
+def test_procesar_por_particiones_igual_que_tablas_enteras(tmp_path):
+    generador = np.random.default_rng(3)
+    # Daily partitions around the 23 and 25 hour days of 2016.
+    horas = pd.date_range(
+        '2016-03-26', '2016-03-28 23:00', freq='H', tz='Europe/Madrid'
+    ).append(pd.date_range(
+        '2016-10-29', '2016-10-31 23:00', freq='H', tz='Europe/Madrid'))
+    tipos = ['PVP', 'P48', 'pot_max', 'pot_hab', 'BRS_cas_sub',
+             'BRS_cas_baj', 'BRS_of_sub', 'BRS_of_baj']
+    centrales_en_empresa = {'E1': ['A', 'B'], 'E2': ['C']}
+    columnas = pd.MultiIndex.from_product([['A', 'B', 'C'], tipos])
+    df_potencias = pd.DataFrame(
+        generador.uniform(0, 100, size=(len(horas), len(columnas))),
+        index=horas, columns=columnas)
+    df_mercado = crear_mercado(horas, generador)
+    carpeta = str(tmp_path) + '/'
+    f.guardar_tabla_columnar(
+        df_potencias, carpeta + 'tabla_potencia_agregada.parquet')
+
+    particiones = f.obtener_particiones_tiempo(horas, 'D')
+    df_corr_empresas, df_corr_centrales = f.procesar_por_particiones(
+        carpeta, centrales_en_empresa, df_mercado, frecuencia='D')
+
+    assert len(particiones) == 6
+    assert [
+        len(horas[(horas >= inicio) & (horas < fin)])
+        for _, inicio, fin in particiones
+    ] == [24, 23, 24, 24, 25, 24]
+    df_margenes = f.calcular_margenes_potencia(df_potencias)
+    for df_marg_pot, df_corr in [
+            (f.agregar_margenes_potencia(df_margenes, centrales_en_empresa),
+             df_corr_empresas),
+            (df_margenes, df_corr_centrales)]:
+        df_mw_imp = f.obtener_mw_imposibles(df_marg_pot)
+        df_esperada = f.obtener_correlaciones(df_mercado, dict(zip(
+            f.NOMBRES_CORRELACIONES, [
+                df_mw_imp,
+                f.obtener_horas_imposibles(df_marg_pot),
+                f.obtener_beneficio_extra(df_mw_imp, df_mercado),
+            ])))
+        pd.testing.assert_frame_equal(
+            df_corr, df_esperada, check_exact=False, rtol=0, atol=1e-10)
+
+
+def test_tablas_dispersas_igual_que_densas(monkeypatch):
+    monkeypatch.setattr(f, 'COLUMNAS_BLOQUE_DISPERSO', 3)
+    generador = np.random.default_rng(4)
+    horas = pd.date_range(
+        '2016-10-29', periods=24*3, freq='H', tz='Europe/Madrid')
+    df_mercado = crear_mercado(horas, generador)
+    df_margenes = crear_margenes(['A', 'B'], horas)
+    df_margenes.iloc[::6, 0] = np.nan
+    df_margenes.iloc[:, 1] = 10.0
+
+    densas = {
+        'MW imposibles': f.obtener_mw_imposibles(df_margenes),
+        'Horas imposibles': f.obtener_horas_imposibles(df_margenes),
+    }
+    dispersas = {
+        'MW imposibles': f.obtener_mw_imposibles(df_margenes, True),
+        'Horas imposibles': f.obtener_horas_imposibles(df_margenes, True),
+    }
+    for tablas in [densas, dispersas]:
+        tablas['Beneficios imposibles'] = f.obtener_beneficio_extra(
+            tablas['MW imposibles'], df_mercado)
+
+    for nombre, df_densa in densas.items():
+        df_dispersa = dispersas[nombre]
+        assert all(
+            isinstance(tipo, pd.SparseDtype) for tipo in df_dispersa.dtypes)
+        pd.testing.assert_frame_equal(
+            df_dispersa.sparse.to_dense(), df_densa)
+    pd.testing.assert_frame_equal(
+        f.obtener_correlaciones(df_mercado, dispersas),
+        f.obtener_correlaciones(df_mercado, densas),
+        check_exact=False, rtol=0, atol=1e-12)
+    # Sparse tables are correlated by blocks of columns, which only
+    # changes the order of the rows of the windowed correlations.
+    pd.testing.assert_frame_equal(
+        f.obtener_correlaciones_ventana(
+            df_mercado, dispersas, ventana=1).sort_index(),
+        f.obtener_correlaciones_ventana(
+            df_mercado, densas, ventana=1).sort_index(),
+        check_exact=False, rtol=0, atol=1e-12)